@@ -1,6 +1,48 @@
 """vaskify."""
 
-from .createdata import create_test_data
-from .detect import Detect
+import importlib
+from typing import TYPE_CHECKING
+from typing import Any
 
-__all__ = ["Detect", "create_test_data"]
+if TYPE_CHECKING:
+    from .createdata import create_test_data
+    from .detect import Detect
+    from .rules import EditRules
+    from .wide import DetectWide
+
+# Public names and their modules. They are imported when first used so that
+# importing the package, for example for the command line, does not import
+# pandas and numpy.
+_lazy_imports = {
+    "Detect": ".detect",
+    "DetectWide": ".wide",
+    "EditRules": ".rules",
+    "create_test_data": ".createdata",
+}
+
+__all__ = ["Detect", "DetectWide", "EditRules", "create_test_data"]
+
+
+def __getattr__(name: str) -> Any:
+    """Import public names on first use.
+
+    Args:
+        name: Name of the attribute.
+
+    Returns:
+        The attribute from its module.
+
+    Raises:
+        AttributeError: If the name is not a public name of the package.
+    """
+    if name not in _lazy_imports:
+        mes = f"module {__name__!r} has no attribute {name!r}"
+        raise AttributeError(mes)
+    value = getattr(importlib.import_module(_lazy_imports[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    """List the attributes of the package including the lazy public names."""
+    return sorted([*globals(), *__all__])
@@ -3,11 +3,57 @@
 import click
 
 
-@click.command()
+@click.group(invoke_without_command=True)
 @click.version_option()
 def main() -> None:
     """Vaskify."""
 
 
+@main.command()
+@click.option("--host", default="127.0.0.1", help="Host address to listen on.")
+@click.option("--port", default=8765, help="Port to listen on.")
+@click.option(
+    "--socket",
+    "socket_path",
+    default="",
+    help="Path for a Unix socket to listen on instead of host and port.",
+)
+@click.option("--workers", default=None, type=int, help="Number of worker threads.")
+def serve(host: str, port: int, socket_path: str, workers: int | None) -> None:
+    """Run a resident detection service."""
+    from .service import serve as run_service  # noqa: PLC0415
+
+    run_service(host=host, port=port, socket_path=socket_path, max_workers=workers)
+
+
+@main.command()
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False))
+@click.option("--output-dir", default="vaskify_output", help="Folder for results.")
+@click.option("--workers", default=None, type=int, help="Number of worker processes.")
+@click.option(
+    "--output-format",
+    default="csv",
+    type=click.Choice(["csv", "parquet", "pkl"]),
+    help="File format for results.",
+)
+def batch(
+    manifest: str,
+    output_dir: str,
+    workers: int | None,
+    output_format: str,
+) -> None:
+    """Run the jobs in a JSON MANIFEST on a process pool."""
+    from .batch import run_batch  # noqa: PLC0415
+
+    timings = run_batch(
+        manifest,
+        output_dir=output_dir,
+        max_workers=workers,
+        output_format=output_format,
+    )
+    n_failed = int((timings["status"] != "ok").sum())
+    click.echo(f"Finished {len(timings)} methods with {n_failed} errors.")
+
+
 if __name__ == "__main__":
     main(prog_name="ssb-vaskify")  # pragma: no cover
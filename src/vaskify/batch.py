@@ -0,0 +1,276 @@
+# %% [markdown]
+# # Batch runner for many datasets
+# Runs the same detection methods on many datasets on a process pool. Columns
+# are passed to the workers through shared memory instead of being pickled.
+
+# %%
+import gc
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from .detect import Detect
+
+
+# %%
+def _share_array(
+    values: np.ndarray,
+) -> tuple[shared_memory.SharedMemory, dict[str, Any]]:
+    """Copy an array into a new shared memory block.
+
+    Args:
+        values: The array to share.
+
+    Returns:
+        The shared memory block and a description of the array for the workers.
+    """
+    block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+    return block, {"shm": block.name, "dtype": values.dtype.str, "length": len(values)}
+
+
+def _share_columns(
+    data: pd.DataFrame,
+) -> tuple[list[shared_memory.SharedMemory], list[dict[str, Any]]]:
+    """Copy the columns of a data frame into shared memory blocks.
+
+    String and other non-numeric columns are factorized so only integer codes are shared. Unique strings are shared as fixed width unicode, while other unique values are passed with the column description.
+
+    Args:
+        data: The data to share.
+
+    Returns:
+        The shared memory blocks and a description of each column for the workers.
+    """
+    blocks = []
+    columns = []
+    for col in data.columns:
+        values = data[col].to_numpy()
+        column: dict[str, Any] = {"name": col, "uniques": None, "strings": None}
+        if values.dtype.kind not in "biufcmM":
+            values, unique_index = pd.factorize(data[col])
+            uniques = unique_index.to_numpy(dtype=object)
+            if all(isinstance(value, str) for value in uniques):
+                block, column["strings"] = _share_array(uniques.astype(str))
+                blocks.append(block)
+            else:
+                column["uniques"] = uniques
+        block, description = _share_array(values)
+        blocks.append(block)
+        columns.append({**column, **description})
+    return blocks, columns
+
+
+def _read_shared(
+    job: dict[str, Any],
+) -> tuple[list[shared_memory.SharedMemory], list[dict[str, Any]]]:
+    """Read the data for a job and copy it into shared memory.
+
+    Args:
+        job: The job from the manifest.
+
+    Returns:
+        The shared memory blocks and a description of each column for the workers.
+    """
+    # Only needed here, so the worker processes do not import asyncio
+    from .service import read_data  # noqa: PLC0415
+
+    data = read_data(job["path"], dtype={job["id_nr"]: str, job["time_var"]: str})
+    return _share_columns(data)
+
+
+def _attach_columns(
+    columns: list[dict[str, Any]],
+    blocks: list[shared_memory.SharedMemory],
+) -> pd.DataFrame:
+    """Create a data frame from shared columns in a worker process.
+
+    Numeric columns are views of the shared memory, so the blocks should stay open while the data is used.
+
+    Args:
+        columns: Description of the shared columns from _share_columns.
+        blocks: List to add the opened shared memory blocks to.
+
+    Returns:
+        The data.
+    """
+
+    def _attach(description: dict[str, Any]) -> np.ndarray:
+        block = shared_memory.SharedMemory(name=description["shm"])
+        blocks.append(block)
+        return np.ndarray(
+            description["length"],
+            dtype=description["dtype"],
+            buffer=block.buf,
+        )
+
+    arrays = {}
+    for col in columns:
+        values = _attach(col)
+        if col["strings"] is not None:
+            uniques = _attach(col["strings"]).astype(object)
+            arrays[col["name"]] = np.append(uniques, np.nan)[values]
+        elif col["uniques"] is not None:
+            arrays[col["name"]] = np.append(col["uniques"], np.nan)[values]
+        else:
+            arrays[col["name"]] = values
+    return pd.DataFrame(arrays, copy=False)
+
+
+def _run_methods(
+    job: dict[str, Any],
+    columns: list[dict[str, Any]],
+    blocks: list[shared_memory.SharedMemory],
+    output_dir: str,
+    output_format: str,
+) -> list[dict[str, Any]]:
+    """Run the methods for one job on the shared columns. See _run_job."""
+    start = time.perf_counter()
+    data = _attach_columns(columns, blocks)
+    detect = Detect(
+        data,
+        id_nr=job["id_nr"],
+        logger_level=job.get("logger_level", "warning"),
+    )
+    load_seconds = time.perf_counter() - start
+
+    results = []
+    for number, spec in enumerate(job["methods"]):
+        method = spec["method"]
+        params = {"time_var": job["time_var"], **spec.get("params", {})}
+        result = {
+            "job": job["name"],
+            "method": method,
+            "rows": len(data),
+            "load_seconds": load_seconds,
+        }
+        start = time.perf_counter()
+        try:
+            output = getattr(detect, method)(**params)
+            path = Path(output_dir) / f"{job['name']}_{number}_{method}.{output_format}"
+            if output_format == "parquet":
+                output.to_parquet(path)
+            elif output_format == "pkl":
+                output.to_pickle(path)
+            else:
+                output.to_csv(path, index=False)
+            result.update({"status": "ok", "output": str(path), "error": ""})
+        except Exception as e:  # noqa: BLE001
+            result.update({"status": "error", "output": "", "error": str(e)})
+        result["seconds"] = time.perf_counter() - start
+        results.append(result)
+    return results
+
+
+def _run_job(
+    job: dict[str, Any],
+    columns: list[dict[str, Any]],
+    output_dir: str,
+    output_format: str,
+) -> list[dict[str, Any]]:
+    """Run the methods for one job in a worker process.
+
+    Args:
+        job: The job from the manifest.
+        columns: Description of the shared columns from _share_columns.
+        output_dir: Folder to write the results to.
+        output_format: File format for the results: 'csv', 'parquet' or 'pkl'.
+
+    Returns:
+        List of dictionaries with timing and status for each method.
+    """
+    blocks: list[shared_memory.SharedMemory] = []
+    try:
+        return _run_methods(job, columns, blocks, output_dir, output_format)
+    finally:
+        # The views of the blocks are released when _run_methods returns
+        gc.collect()
+        for block in blocks:
+            block.close()
+
+
+def run_batch(
+    manifest: str | list[dict[str, Any]],
+    output_dir: str,
+    max_workers: int | None = None,
+    output_format: str = "csv",
+) -> pd.DataFrame:
+    """Run detection methods for many datasets on a process pool.
+
+    Each job in the manifest is a dictionary with the keys 'path', 'id_nr', 'time_var' and 'methods', and optionally 'name' and 'logger_level'. 'methods' is a list of dictionaries with the name of a Detect method under 'method' and its arguments under 'params', for example {'method': 'hb', 'params': {'y_var': 'turnover'}}. The time_var is added to the arguments of each method.
+
+    The data for the next jobs is read on a thread pool while earlier jobs run, and passed to a worker through shared memory. Results are written to output_dir as '<name>_<number>_<method>.<output_format>', together with 'timings.csv'.
+
+    Args:
+        manifest: Path to a JSON file with a list of jobs, or the list of jobs.
+        output_dir: Folder to write the results to. It is created if needed.
+        max_workers: Number of worker processes. Default None uses the number of processors.
+        output_format: File format for the results: 'csv', 'parquet' or 'pkl'.
+
+    Returns:
+        Data frame with timing and status for each job and method.
+    """
+    if isinstance(manifest, str):
+        with Path(manifest).open() as file:
+            jobs: list[dict[str, Any]] = json.load(file)
+    else:
+        jobs = manifest
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    results: list[dict[str, Any]] = []
+    pending: dict[Future[list[dict[str, Any]]], list[shared_memory.SharedMemory]] = {}
+
+    def _collect(futures: set[Future[list[dict[str, Any]]]]) -> None:
+        # The futures are done, so the workers no longer need the shared memory
+        for future in futures:
+            for block in pending.pop(future):
+                block.close()
+                block.unlink()
+            results.extend(future.result())
+
+    # Limit the number of jobs read or held in shared memory at the same time
+    n_workers = max_workers or os.cpu_count() or 1
+    max_pending = 2 * n_workers
+    queue = [
+        {"name": f"{Path(job['path']).stem}_{number}", **job}
+        for number, job in enumerate(jobs)
+    ]
+    reads: deque[
+        tuple[dict[str, Any], Future[tuple[list[Any], list[dict[str, Any]]]]]
+    ] = deque()
+    with (
+        ProcessPoolExecutor(max_workers=max_workers) as pool,
+        ThreadPoolExecutor(max_workers=n_workers) as readers,
+    ):
+        while queue or reads or pending:
+            while queue and len(reads) + len(pending) < max_pending:
+                job = queue.pop(0)
+                reads.append((job, readers.submit(_read_shared, job)))
+
+            # Start the jobs in order as soon as their data is read
+            waiting: set[Future[Any]] = set(pending)
+            if reads:
+                waiting.add(reads[0][1])
+            done, _ = wait(waiting, return_when=FIRST_COMPLETED)
+            _collect({future for future in done if future in pending})
+            while reads and reads[0][1].done():
+                job, read = reads.popleft()
+                blocks, columns = read.result()
+                future = pool.submit(_run_job, job, columns, output_dir, output_format)
+                pending[future] = blocks
+
+    timings = pd.DataFrame(results)
+    timings.to_csv(Path(output_dir) / "timings.csv", index=False)
+    return timings
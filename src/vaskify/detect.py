@@ -4,16 +4,67 @@
 #
 # - Add in data checks
 # - Stratification option
-# - Impute for accumulative error
 # - Documentation
 
 # %%
+import hashlib
+import inspect
+import itertools
+import json
 import logging
 import re
+import threading
+from pathlib import Path
+from typing import Any
+from typing import NamedTuple
 
 import numpy as np
 import pandas as pd
 
+# %%
+# Shared parent logger for all Detect instances. Handlers are only added here
+# while each instance logs through its own child logger with its own level.
+_logger_lock = threading.Lock()
+_logger_count = itertools.count()
+
+
+def _get_instance_logger() -> logging.Logger:
+    """Create a child logger of 'detect' for one Detect instance.
+
+    The child is not registered with the logging manager so it is garbage collected with its instance.
+
+    Returns:
+        A new logger that propagates to the 'detect' logger.
+    """
+    parent = logging.getLogger("detect")
+    with _logger_lock:
+        if not parent.handlers:  # Avoid adding multiple handlers
+            formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(formatter)
+            parent.addHandler(console_handler)
+        logger = logging.Logger(f"detect.{next(_logger_count)}")  # noqa: LOG001
+    logger.parent = parent
+    return logger
+
+
+def _is_dask_frame(data: Any) -> bool:
+    """Check if data is a Dask dataframe without importing dask."""
+    return type(data).__module__.split(".")[0] == "dask"
+
+
+# Version of the folder format written by Detect.save
+_SAVE_VERSION = 1
+
+
+class _Panel(NamedTuple):
+    """Data prepared for one time variable, sorted by unit and time."""
+
+    data: pd.DataFrame  # data with any duplicates resolved
+    order: np.ndarray  # row order for sorting data
+    unit_codes: np.ndarray  # unit code for each sorted row
+    unit_starts: np.ndarray  # sorted position where each unit starts
+
 
 # %%
 class Detect:
@@ -24,20 +75,46 @@ class Detect:
         data: pd.DataFrame,
         id_nr: str,
         logger_level: str = "warning",
+        duplicates: str = "error",
+        parent_id: str | list[str] = "",
     ) -> None:
         """Initialize general data editing object.
 
         Args:
-            data: Pandas dataframe to be controlled/edited. If multiple time periods are in the data, the data should be in a long format.
+            data: Pandas dataframe to be controlled/edited. If multiple time periods are in the data, the data should be in a long format. A Dask dataframe can also be used, see the methods for the supported options.
             id_nr: String variable for the name of the variable to identify units with.
             logger_level: Detail level for information output. Choose between 'debug','info','warning','error' and 'critical'.
+            duplicates: How to handle several rows for the same unit and time period. 'error' raises an error when a method is run. 'first' or 'last' keep one row, and 'sum' or 'max' combine the numeric variables. Default is 'error'.
+            parent_id: String variable, or list of variables from the closest to the highest level, identifying the parent unit of each unit, for example the enterprise of an establishment. Used by run_levels. Default is blank ("").
+
+        Raises:
+            ValueError: If duplicates is not a valid option.
         """
         # Check data
         self._check_data(data, id_nr=id_nr)
+        parent_ids = [parent_id] if isinstance(parent_id, str) else parent_id
+        for col in parent_ids:
+            if col:
+                self._check_data(data, id_nr=col)
+        if duplicates not in ("error", "first", "last", "sum", "max"):
+            mes = "duplicates should be 'error', 'first', 'last', 'sum' or 'max'."
+            raise ValueError(mes)
 
         # Create self variables
         self.data = data
         self.id_nr = id_nr
+        self.duplicates = duplicates
+        self.parent_id = [col for col in parent_ids if col]
+
+        # Key codes and sorted panels are prepared once and reused
+        self._codes: dict[str, tuple[pd.DataFrame, np.ndarray, int]] = {}
+        self._panels: dict[str, tuple[pd.DataFrame, _Panel]] = {}
+        self._hb_tables: dict[str, tuple[pd.DataFrame, pd.DataFrame]] = {}
+        self._panel_lock = threading.RLock()
+
+        # Dask data is checked and processed one partition at a time
+        self._is_dask = _is_dask_frame(data)
+        self._units: Any = None
 
         # Start logging
         logging_dict = {
@@ -47,16 +124,145 @@ class Detect:
             "error": 40,
             "critical": 50,
         }
-        self.logger = logging.getLogger("detect")
+        self.logger = _get_instance_logger()
         self.logger.setLevel(logging_dict[logger_level])
 
-        # add in console handling
-        if not self.logger.handlers:  # Avoid adding multiple handlers
-            formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-            console_handler = logging.StreamHandler()
-            console_handler.setLevel(logging_dict[logger_level])
-            console_handler.setFormatter(formatter)
-            self.logger.addHandler(console_handler)
+    @classmethod
+    def from_arrow(
+        cls,
+        path: str,
+        id_nr: str,
+        logger_level: str = "warning",
+    ) -> "Detect":
+        """Create a Detect object from a memory-mapped Arrow IPC (Feather v2) file.
+
+        Numeric columns without missing values and string columns are read without copying, so only the parts of the file that are used are read from disk. Several processes can map the same file. Requires the pyarrow package.
+
+        Args:
+            path: Path to an uncompressed Arrow IPC file.
+            id_nr: String variable for the name of the variable to identify units with.
+            logger_level: Detail level for information output. Choose between 'debug','info','warning','error' and 'critical'.
+
+        Returns:
+            Detect object with the mapped data.
+
+        Raises:
+            ImportError: If pyarrow is not installed.
+        """
+        try:
+            import pyarrow as pa  # noqa: PLC0415
+        except ImportError as e:
+            mes = "pyarrow is needed to read Arrow files. Install it with 'poetry add pyarrow'."
+            raise ImportError(mes) from e
+
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+        # Keep strings in Arrow memory, numeric columns become numpy views
+        def _types_mapper(arrow_type: Any) -> pd.ArrowDtype | None:
+            if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+                return pd.ArrowDtype(arrow_type)
+            return None
+
+        data = table.to_pandas(split_blocks=True, types_mapper=_types_mapper)
+        return cls(data, id_nr=id_nr, logger_level=logger_level)
+
+    @classmethod
+    def from_npy(
+        cls,
+        path: str,
+        id_nr: str,
+        columns: list[str] | None = None,
+        logger_level: str = "warning",
+    ) -> "Detect":
+        """Create a Detect object from a folder of memory-mapped '.npy' column files.
+
+        Each column is stored in its own file named after the column, for example 'turnover.npy'. Numeric columns are memory-mapped without copying. String columns, such as id_nr and the time variable, are stored as fixed width unicode and converted when loaded.
+
+        Args:
+            path: Path to the folder with the column files.
+            id_nr: String variable for the name of the variable to identify units with.
+            columns: List of columns to load. Default None loads all '.npy' files in the folder.
+            logger_level: Detail level for information output. Choose between 'debug','info','warning','error' and 'critical'.
+
+        Returns:
+            Detect object with the mapped data.
+        """
+        folder = Path(path)
+        if columns is None:
+            columns = sorted(file.stem for file in folder.glob("*.npy"))
+
+        arrays = {}
+        for col in columns:
+            array = np.load(folder / f"{col}.npy", mmap_mode="r")
+            arrays[col] = array.astype(object) if array.dtype.kind == "U" else array
+        data = pd.DataFrame(arrays, copy=False)
+        return cls(data, id_nr=id_nr, logger_level=logger_level)
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        data: pd.DataFrame | None = None,
+        logger_level: str = "warning",
+    ) -> "Detect":
+        """Create a Detect object from a prepared panel saved with save.
+
+        The columns, sort order and codes are memory-mapped, so the panel does not need to be sorted again. HB limits that were saved are reused by hb with the same arguments. String columns are converted when loaded.
+
+        Args:
+            path: Path to the folder written by save.
+            data: The source data that was saved. If given, the saved panel is only used if the data has not changed since. Default None does not check the data.
+            logger_level: Detail level for information output. Choose between 'debug','info','warning','error' and 'critical'.
+
+        Returns:
+            Detect object with the mapped panel.
+
+        Raises:
+            ValueError: If the saved panel is from another version or the data has changed.
+        """
+        folder = Path(path)
+        meta = json.loads((folder / "meta.json").read_text())
+        if meta["version"] != _SAVE_VERSION:
+            mes = f"The panel in {path} was saved with another version and should be saved again."
+            raise ValueError(mes)
+        if data is not None and cls._checksum(data) != meta["checksum"]:
+            mes = f"The data has changed since the panel in {path} was saved. Use save again."
+            raise ValueError(mes)
+
+        arrays = {}
+        string_codes = {}
+        for i, col in enumerate(meta["columns"]):
+            array = np.load(folder / f"column_{i}.npy", mmap_mode="r")
+            if col["kind"] == "codes":
+                uniques = np.load(folder / f"column_{i}_uniques.npy")
+                string_codes[col["name"]] = (array, len(uniques))
+                array = np.append(uniques.astype(object), np.nan)[array]
+            elif str(array.dtype) != col["dtype"]:
+                array = pd.array(array, dtype=col["dtype"])
+            arrays[col["name"]] = array
+        loaded = pd.DataFrame(arrays, copy=False)
+
+        detect = cls(
+            loaded,
+            id_nr=meta["id_nr"],
+            logger_level=logger_level,
+            duplicates=meta["duplicates"],
+            parent_id=meta["parent_id"],
+        )
+        for col, (codes, n_uniques) in string_codes.items():
+            detect._codes[col] = (loaded, codes, n_uniques)
+        detect._panels[meta["time_var"]] = (
+            loaded,
+            _Panel(
+                loaded,
+                np.load(folder / "order.npy", mmap_mode="r"),
+                np.load(folder / "unit_codes.npy", mmap_mode="r"),
+                np.load(folder / "unit_starts.npy", mmap_mode="r"),
+            ),
+        )
+        for key, table in meta["hb_tables"].items():
+            detect._hb_tables[key] = (loaded, pd.DataFrame(table))
+        return detect
 
     @staticmethod
     def _is_valid_date_format(date_str: str) -> bool:
@@ -117,6 +323,11 @@ class Detect:
         Raises:
             ValueError: If any of the checks fail.
         """
+        if _is_dask_frame(data):
+            # Only the columns and types are checked here. The values are checked
+            # for each partition when a method is run.
+            data = self._dask_meta(data)
+
         required_columns = [y_var, time_var, id_nr]
         for col in required_columns:
             if col and col not in data.columns:
@@ -135,12 +346,70 @@ class Detect:
                 mes = f"{time_var} should be a string."
                 raise ValueError(mes)
 
-            if not data[time_var].apply(self._is_valid_date_format).all():
+            time_levels = pd.unique(data[time_var])
+            if not all(self._is_valid_date_format(level) for level in time_levels):
                 mes = f"{time_var} should be in the format 'YYYY', 'YYYY-Qq', 'YYYY-MM','YYYY-Www','YYYY-MM-DD', 'YYYY-DDD'."
                 raise ValueError(mes)
 
+            if data is self.data:
+                self._check_duplicates(time_var)
+
+    def _factorize(self, col: str) -> tuple[np.ndarray, int]:
+        """Convert a column of the data to sorted integer codes.
+
+        The codes are cached for each column.
+
+        Args:
+            col: Name of the column.
+
+        Returns:
+            Array of codes and the number of unique values.
+        """
+        with self._panel_lock:
+            cached = self._codes.get(col)
+            if cached is None or cached[0] is not self.data:
+                codes, uniques = pd.factorize(self.data[col], sort=True)
+                cached = (self.data, codes, len(uniques))
+                self._codes[col] = cached
+        return cached[1], cached[2]
+
+    def _key_codes(self, time_var: str) -> np.ndarray:
+        """Combine the unit and time period codes into one integer key for each row.
+
+        Args:
+            time_var: String variable for indicating the time period.
+
+        Returns:
+            Array of integer keys.
+        """
+        unit_codes, _ = self._factorize(self.id_nr)
+        time_codes, n_times = self._factorize(time_var)
+        keys: np.ndarray = unit_codes.astype(np.int64) * max(n_times, 1) + time_codes
+        return keys
+
+    def _check_duplicates(self, time_var: str) -> None:
+        """Check for several rows with the same unit and time period.
+
+        Args:
+            time_var: String variable for indicating the time period.
+
+        Raises:
+            ValueError: If there are duplicates and the duplicates option is 'error'.
+        """
+        keys = self._key_codes(time_var)
+        n_duplicates = len(keys) - len(pd.unique(keys))
+        if n_duplicates == 0:
+            return
+
+        mes = f"Found {n_duplicates} duplicate rows for {self.id_nr} and {time_var}."
+        if self.duplicates == "error":
+            mes += " Use duplicates='first', 'last', 'sum' or 'max' in Detect to resolve them."
+            raise ValueError(mes)
+        mes += f" Resolving with '{self.duplicates}'."
+        self.logger.info(mes)
+
     def change_logging_level(self, logger_level: str) -> None:
-        """Change the logging print level.
+        """Change the logging print level for this instance only.
 
         Args:
             logger_level: Detail level for information output. Choose between 'debug','info','warning','error' and 'critical'.
@@ -154,6 +423,607 @@ class Detect:
         }
         self.logger.setLevel(logging_dict[logger_level])
 
+    def run_concurrent(
+        self,
+        specs: list[dict[str, Any]],
+        max_workers: int | None = None,
+    ) -> list[pd.DataFrame]:
+        """Run several detection methods on a thread pool.
+
+        The methods do not change the instance, so independent checks can run at the same time. Most of the work is done in NumPy and pandas which release the GIL.
+
+        Args:
+            specs: List of dictionaries with the method name under 'method' and the method arguments, for example {'method': 'hb', 'y_var': 'turnover', 'time_var': 'time_period'}.
+            max_workers: Maximum number of threads. Default None uses the ThreadPoolExecutor default.
+
+        Returns:
+            List of outputs in the same order as specs.
+
+        Raises:
+            ValueError: If a method in specs is not a detection method.
+        """
+        methods = ("thousand_error", "accumulation_error", "hb")
+        for spec in specs:
+            if spec.get("method") not in methods:
+                mes = f"method should be one of {methods}, not {spec.get('method')}."
+                raise ValueError(mes)
+
+        from concurrent.futures import ThreadPoolExecutor  # noqa: PLC0415
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(
+                    getattr(self, spec["method"]),
+                    **{key: value for key, value in spec.items() if key != "method"},
+                )
+                for spec in specs
+            ]
+            return [future.result() for future in futures]
+
+    def _aggregate_parent(
+        self,
+        sorted_data: pd.DataFrame,
+        parent: str,
+        time_var: str,
+    ) -> tuple[pd.DataFrame, np.ndarray, pd.Index, np.ndarray]:
+        """Sum the numeric variables of the units in each parent unit and time period.
+
+        The rows are sorted by parent and time, and each segment of rows is summed with np.add.reduceat. Other variables are taken from the first unit in the segment.
+
+        Args:
+            sorted_data: Data sorted by unit and time.
+            parent: String variable identifying the parent unit.
+            time_var: String variable for indicating the time period.
+
+        Returns:
+            Data frame with one row per parent unit and time period sorted by parent and time, the code of the parent of each row of sorted_data, the sorted parent units, and the position of the parent row for each row of sorted_data. Codes and positions are -1 if the parent is missing.
+
+        Raises:
+            ValueError: If all parent units are missing.
+        """
+        parent_codes, parent_index = pd.factorize(sorted_data[parent], sort=True)
+        time_codes, time_index = pd.factorize(sorted_data[time_var], sort=True)
+        rows = np.flatnonzero(parent_codes >= 0)
+        if len(rows) == 0:
+            mes = f"{parent} is missing for all units."
+            raise ValueError(mes)
+        keys = parent_codes[rows].astype(np.int64) * len(time_index) + time_codes[rows]
+        key_order = np.argsort(keys, kind="stable")
+        order = rows[key_order]
+        is_start = np.ones(len(order), dtype=bool)
+        is_start[1:] = keys[key_order][1:] != keys[key_order][:-1]
+        starts = np.flatnonzero(is_start)
+        segments = np.full(len(sorted_data), -1)
+        segments[order] = np.cumsum(is_start) - 1
+
+        # Segment sums, missing if no unit in the segment has a value
+        numeric = [
+            col
+            for col in sorted_data.columns
+            if pd.api.types.is_numeric_dtype(sorted_data[col])
+        ]
+        values = sorted_data[numeric].to_numpy(dtype=float, na_value=np.nan)[order]
+        sums = np.add.reduceat(np.nan_to_num(values), starts, axis=0)
+        counts = np.add.reduceat(~np.isnan(values), starts, axis=0)
+        sums[counts == 0] = np.nan
+
+        parent_data = (
+            sorted_data.iloc[order[starts]]
+            .drop(columns=self.id_nr)
+            .reset_index(drop=True)
+        )
+        for j, col in enumerate(numeric):
+            parent_data[col] = sums[:, j]
+        return parent_data, parent_codes, pd.Index(parent_index), segments
+
+    def run_levels(self, method: str, **kwargs: Any) -> pd.DataFrame:
+        """Run a detection method for the units and for each level of parent units.
+
+        Parent units are checked using the sums of the numeric variables of their units. The flag and score of the parent are added to each unit as '<flag>_<parent_id>' and '<score>_<parent_id>'. For hb this is the parent of the unit in its last period.
+
+        Args:
+            method: Name of the method. Choose between 'thousand_error', 'accumulation_error', 'rolling_median' and 'hb'.
+            **kwargs: Arguments for the method, including y_var and time_var. Only the 'data' output format ('wide' for hb) is supported.
+
+        Returns:
+            The output of the method for the units, with the flag and score of each level of parent units.
+
+        Raises:
+            ValueError: If parent_id is not given in Detect, or the method or options are not supported.
+        """
+        methods = ("thousand_error", "accumulation_error", "rolling_median", "hb")
+        if not self.parent_id:
+            mes = "parent_id should be given in Detect to use run_levels."
+            raise ValueError(mes)
+        if method not in methods:
+            mes = f"method should be one of {methods}, not {method}."
+            raise ValueError(mes)
+        parameters = inspect.signature(getattr(self, method)).parameters
+        output_format = kwargs.get("output_format", parameters["output_format"].default)
+        if kwargs.get("top_k") is not None or output_format not in ("data", "wide"):
+            mes = "run_levels only supports the 'data' output format, or 'wide' for hb."
+            raise ValueError(mes)
+        flag = kwargs.get("flag", parameters["flag"].default)
+        score = kwargs.get("score", parameters["score"].default)
+
+        output: pd.DataFrame = getattr(self, method)(**kwargs)
+        panel = self._sort_panel(kwargs["time_var"])
+        sorted_data = panel.data.iloc[panel.order].reset_index(drop=True)
+
+        # Find the sorted row of each output row
+        if method == "hb":
+            unit_ends = np.append(panel.unit_starts[1:], len(sorted_data)) - 1
+            unit_ids = pd.Index(sorted_data[self.id_nr].to_numpy()[panel.unit_starts])
+            rows = unit_ends[unit_ids.get_indexer(output[self.id_nr])]
+        else:
+            rows = np.arange(len(output))
+
+        for parent in self.parent_id:
+            parent_data, parent_codes, parent_index, segments = self._aggregate_parent(
+                sorted_data,
+                parent,
+                kwargs["time_var"],
+            )
+            parent_output = getattr(
+                Detect(
+                    parent_data,
+                    id_nr=parent,
+                    logger_level=logging.getLevelName(self.logger.level).lower(),
+                ),
+                method,
+            )(**kwargs)
+
+            # Map the parent rows to the rows of the units
+            if method == "hb":
+                positions = np.full(len(parent_index) + 1, -1)
+                positions[parent_index.get_indexer(parent_output[parent])] = np.arange(
+                    len(parent_output),
+                )
+                found = positions[parent_codes[rows]]
+            else:
+                found = segments[rows]
+            for col in (flag, score):
+                values = np.append(parent_output[col].to_numpy(dtype=float), np.nan)
+                output[f"{col}_{parent}"] = values[found]
+        return output
+
+    def prepare(self, time_var: str) -> None:
+        """Check the time variable and prepare the sorted panel in advance.
+
+        The sorted panel is otherwise prepared by the first method that uses it.
+
+        Args:
+            time_var: String variable for indicating the time period.
+        """
+        self._check_data(self.data, time_var=time_var)
+        self._sort_panel(time_var)
+
+    @staticmethod
+    def _checksum(data: pd.DataFrame) -> str:
+        """Calculate a checksum of the column names, types and values of the data.
+
+        Args:
+            data: The data.
+
+        Returns:
+            Hexadecimal SHA-256 checksum.
+        """
+        checksum = hashlib.sha256()
+        checksum.update(
+            json.dumps(
+                [[str(col), str(data[col].dtype)] for col in data.columns],
+            ).encode(),
+        )
+        for col in data.columns:
+            values = data[col]
+            if isinstance(values.dtype, np.dtype) and values.dtype.kind in "biufmM":
+                checksum.update(np.ascontiguousarray(values.to_numpy()).data)
+            else:
+                hashed = pd.util.hash_pandas_object(values, index=False)
+                checksum.update(hashed.to_numpy().data)
+        return checksum.hexdigest()
+
+    def save(self, path: str, time_var: str) -> None:
+        """Save the prepared panel to a folder for fast reloading with load.
+
+        The columns are saved as '.npy' files with string columns as sorted integer codes, together with the sort order by unit and time and a checksum of the data. HB limits already calculated for the data are saved with their arguments.
+
+        Args:
+            path: Path to the folder. It is created if it does not exist.
+            time_var: String variable for indicating the time period.
+
+        Raises:
+            ValueError: If a column can not be saved.
+        """
+        self.prepare(time_var)
+        panel = self._sort_panel(time_var)
+        folder = Path(path)
+        folder.mkdir(parents=True, exist_ok=True)
+
+        columns = []
+        for i, col in enumerate(panel.data.columns):
+            values = panel.data[col]
+            if pd.api.types.is_string_dtype(values):
+                codes, uniques = pd.factorize(values, sort=True)
+                np.save(folder / f"column_{i}.npy", codes)
+                np.save(
+                    folder / f"column_{i}_uniques.npy",
+                    np.asarray(uniques, dtype=str),
+                )
+                kind = "codes"
+            elif isinstance(values.dtype, np.dtype) and values.dtype.kind in "biufmM":
+                np.save(folder / f"column_{i}.npy", values.to_numpy())
+                kind = "values"
+            elif pd.api.types.is_numeric_dtype(values):
+                np.save(
+                    folder / f"column_{i}.npy",
+                    values.to_numpy(dtype=float, na_value=np.nan),
+                )
+                kind = "values"
+            else:
+                mes = f"{col} with type {values.dtype} can not be saved."
+                raise ValueError(mes)
+            columns.append({"name": col, "dtype": str(values.dtype), "kind": kind})
+
+        np.save(folder / "order.npy", panel.order)
+        np.save(folder / "unit_codes.npy", panel.unit_codes)
+        np.save(folder / "unit_starts.npy", panel.unit_starts)
+
+        with self._panel_lock:
+            hb_tables = {
+                key: table.to_dict(orient="list")
+                for key, (data, table) in self._hb_tables.items()
+                if data is self.data and json.loads(key)["time_var"] == time_var
+            }
+        meta = {
+            "version": _SAVE_VERSION,
+            "id_nr": self.id_nr,
+            "time_var": time_var,
+            "duplicates": self.duplicates,
+            "parent_id": self.parent_id,
+            "checksum": self._checksum(self.data),
+            "columns": columns,
+            "hb_tables": hb_tables,
+        }
+        (folder / "meta.json").write_text(json.dumps(meta))
+
+    def _sort_panel(self, time_var: str) -> _Panel:
+        """Find the sort order of the data by unit and time and locate where each unit starts.
+
+        Duplicate rows for a unit and time period are resolved using the duplicates option. The result is cached for each time variable, so the data should not be changed in place after the instance is created.
+
+        Args:
+            time_var: String variable for indicating the time period.
+
+        Returns:
+            The prepared panel.
+
+        Raises:
+            ValueError: If the data is a Dask dataframe.
+        """
+        if self._is_dask:
+            mes = "This is not supported for Dask data. Use .compute() to get a pandas dataframe first."
+            raise ValueError(mes)
+        with self._panel_lock:
+            cached = self._panels.get(time_var)
+            if cached is None or cached[0] is not self.data:
+                cached = (self.data, self._prepare_panel(time_var))
+                self._panels[time_var] = cached
+        return cached[1]
+
+    def _prepare_panel(self, time_var: str) -> _Panel:
+        """Sort the data by unit and time. See _sort_panel."""
+        data = self.data
+        keys = self._key_codes(time_var)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        is_new_key = np.ones(len(order), dtype=bool)
+        is_new_key[1:] = sorted_keys[1:] != sorted_keys[:-1]
+
+        if not is_new_key.all():
+            data = self._resolve_duplicates(data.iloc[order], is_new_key)
+            order = np.arange(len(data))
+            sorted_keys = sorted_keys[is_new_key]
+
+        unit_codes = sorted_keys // max(self._factorize(time_var)[1], 1)
+        is_start = np.ones(len(order), dtype=bool)
+        is_start[1:] = unit_codes[1:] != unit_codes[:-1]
+        return _Panel(data, order, unit_codes, np.flatnonzero(is_start))
+
+    def _resolve_duplicates(
+        self,
+        data: pd.DataFrame,
+        is_new_key: np.ndarray,
+    ) -> pd.DataFrame:
+        """Combine duplicate rows using the duplicates option.
+
+        Args:
+            data: Data sorted by unit and time, so duplicates are next to each other.
+            is_new_key: Boolean array marking the first row of each unit and time period.
+
+        Returns:
+            Data with one row for each unit and time period.
+        """
+        starts = np.flatnonzero(is_new_key)
+        if self.duplicates == "last":
+            ends = np.append(starts[1:], len(data)) - 1
+            return data.iloc[ends].reset_index(drop=True)
+
+        resolved = data.iloc[starts].reset_index(drop=True)
+        if self.duplicates in ("sum", "max"):
+            for col in data.columns:
+                if col == self.id_nr or not pd.api.types.is_numeric_dtype(data[col]):
+                    continue
+                values = data[col].to_numpy(dtype=float, na_value=np.nan)
+                is_value = ~np.isnan(values)
+                if self.duplicates == "sum":
+                    totals = np.add.reduceat(np.where(is_value, values, 0), starts)
+                else:
+                    totals = np.fmax.reduceat(values, starts)
+                has_value = np.add.reduceat(is_value, starts) > 0
+                resolved[col] = np.where(has_value, totals, np.nan)
+                if pd.api.types.is_integer_dtype(data[col]):
+                    resolved[col] = resolved[col].astype(data[col].dtype)
+        return resolved
+
+    @staticmethod
+    def _dask_meta(data: Any) -> pd.DataFrame:
+        """Create an empty pandas dataframe with the variables and types of Dask data.
+
+        A named index is included as a variable.
+
+        Args:
+            data: The Dask dataframe.
+
+        Returns:
+            Empty data frame.
+        """
+        meta = {}
+        if data.index.name is not None:
+            meta[data.index.name] = pd.Series(dtype=data.index.dtype)
+        meta.update({col: pd.Series(dtype=dtype) for col, dtype in data.dtypes.items()})
+        return pd.DataFrame(meta)
+
+    def _partition_units(self) -> Any:
+        """Get the Dask data with all rows for each unit in the same partition.
+
+        Data with id_nr as the index and known divisions is already partitioned by unit. Otherwise the units in the partitions are compared, and the data is shuffled by id_nr if a unit is in more than one partition. The result is cached.
+
+        Returns:
+            Dask dataframe with id_nr as a variable.
+        """
+        with self._panel_lock:
+            if self._units is not None:
+                return self._units
+            data: Any = self.data
+            is_aligned = False
+            if data.index.name == self.id_nr and self.id_nr not in data.columns:
+                is_aligned = data.known_divisions
+                data = data.reset_index()
+            if not is_aligned:
+                units = data[self.id_nr].map_partitions(pd.Series.drop_duplicates)
+                if units.compute().duplicated().any():
+                    mes = f"Units are in more than one partition, so the data is shuffled by {self.id_nr}."
+                    self.logger.info(mes)
+                    data = data.shuffle(on=self.id_nr)
+            self._units = data
+        return data
+
+    @staticmethod
+    def _run_partition(
+        part: pd.DataFrame,
+        empty: pd.DataFrame,
+        id_nr: str,
+        duplicates: str,
+        logger_level: str,
+        method: str,
+        kwargs: dict[str, Any],
+    ) -> pd.DataFrame:
+        """Run a method with a new Detect instance for one partition of Dask data."""
+        if part.empty:
+            return empty
+        detect = Detect(
+            part,
+            id_nr=id_nr,
+            logger_level=logger_level,
+            duplicates=duplicates,
+        )
+        output: pd.DataFrame = getattr(detect, method)(**kwargs)
+        return output
+
+    def _map_units(self, method: str, new_columns: list[str], **kwargs: Any) -> Any:
+        """Run a method on each partition of Dask data with all rows for a unit in the same partition.
+
+        Args:
+            method: Name of the method to run.
+            new_columns: Names of the numeric variables added by the method.
+            **kwargs: Arguments for the method.
+
+        Returns:
+            Dask dataframe with the output of the method for all partitions.
+
+        Raises:
+            ValueError: If top_k or the 'summary' output format is used.
+        """
+        if kwargs.get("top_k") is not None or kwargs.get("output_format") == "summary":
+            mes = "top_k and output_format='summary' are not supported for Dask data. Use .compute() to get a pandas dataframe first."
+            raise ValueError(mes)
+
+        data = self._partition_units()
+        meta = self._dask_meta(data)
+        for col in new_columns:
+            meta[col] = pd.Series(dtype=float)
+        return data.map_partitions(
+            self._run_partition,
+            meta,
+            self.id_nr,
+            self.duplicates,
+            logging.getLevelName(self.logger.level).lower(),
+            method,
+            kwargs,
+            meta=meta,
+        )
+
+    @staticmethod
+    def _top_k(
+        score: np.ndarray,
+        k: int,
+        groups: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """Find the positions of the k highest scores, optionally within each group.
+
+        Missing scores are never selected. Without groups, np.argpartition is used so only the k selected scores are sorted.
+
+        Args:
+            score: Array of suspicion scores.
+            k: Number of positions to return (per group).
+            groups: Optional array of integer group codes.
+
+        Returns:
+            Array of positions ordered by descending score (within group).
+        """
+        valid = np.flatnonzero(~np.isnan(score))
+        if groups is None:
+            if k < len(valid):
+                valid = valid[np.argpartition(-score[valid], k - 1)[:k]]
+            return valid[np.argsort(-score[valid], kind="stable")]
+
+        order = valid[np.lexsort((-score[valid], groups[valid]))]
+        sorted_groups = groups[order]
+        is_start = np.ones(len(order), dtype=bool)
+        is_start[1:] = sorted_groups[1:] != sorted_groups[:-1]
+        group_start = np.maximum.accumulate(
+            np.where(is_start, np.arange(len(order)), 0),
+        )
+        rank = np.arange(len(order)) - group_start
+        return order[rank < k]
+
+    def _top_k_units(
+        self,
+        unit_codes: np.ndarray,
+        unit_starts: np.ndarray,
+        score: np.ndarray,
+        top_k: int,
+        top_k_by: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """Find the rows with the highest score for the k most suspicious units.
+
+        Args:
+            unit_codes: Unit code for each row, sorted by unit and time.
+            unit_starts: Row position where each unit starts.
+            score: Suspicion score for each row.
+            top_k: Number of units to return (per group).
+            top_k_by: Optional array of values for each row to select the top units within.
+
+        Returns:
+            Array of row positions, one for each selected unit.
+        """
+        if len(score) == 0:
+            return np.array([], dtype=int)
+
+        # Each unit is represented by its most suspicious row
+        with np.errstate(invalid="ignore"):
+            unit_score = np.fmax.reduceat(score, unit_starts)
+        is_peak = score == unit_score[unit_codes]
+        peak_units, first_peak = np.unique(unit_codes[is_peak], return_index=True)
+        peak_rows = np.zeros(len(unit_starts), dtype=int)
+        peak_rows[peak_units] = np.flatnonzero(is_peak)[first_peak]
+
+        groups = None
+        if top_k_by is not None:
+            groups = pd.factorize(top_k_by[peak_rows])[0]
+        rows: np.ndarray = peak_rows[self._top_k(unit_score, top_k, groups)]
+        return rows
+
+    @staticmethod
+    def _summarize_flags(
+        flag_values: np.ndarray,
+        y: np.ndarray,
+        keys: dict[str, np.ndarray],
+        y_var: str,
+    ) -> pd.DataFrame:
+        """Count flags and sum the flagged values for each group.
+
+        Args:
+            flag_values: Array of flags (1, 0 or missing when not checked).
+            y: Array of values for the variable of interest.
+            keys: Dictionary of variable names and the arrays of values to group by.
+            y_var: The name of the variable of interest.
+
+        Returns:
+            Data frame with one row for each group. Rows with a missing key are left out.
+        """
+        # Combine the keys into one integer group code, leaving out missing keys
+        key_codes = [pd.factorize(values, sort=True) for values in keys.values()]
+        has_keys = np.logical_and.reduce([codes >= 0 for codes, _ in key_codes])
+        flag_values, y = flag_values[has_keys], y[has_keys]
+        keys = {name: values[has_keys] for name, values in keys.items()}
+        shape = tuple(max(len(uniques), 1) for _, uniques in key_codes)
+        combined = np.ravel_multi_index(
+            [codes[has_keys] for codes, _ in key_codes],
+            shape,
+        )
+        groups, first_row, group_codes = np.unique(
+            combined,
+            return_index=True,
+            return_inverse=True,
+        )
+
+        n_groups = len(groups)
+        is_flagged = flag_values == 1
+        y_values = np.nan_to_num(y, nan=0.0, posinf=0.0, neginf=0.0)
+        n_checked = np.bincount(
+            group_codes,
+            weights=~np.isnan(flag_values),
+            minlength=n_groups,
+        )
+        n_flagged = np.bincount(group_codes, weights=is_flagged, minlength=n_groups)
+        y_total = np.bincount(group_codes, weights=y_values, minlength=n_groups)
+        y_flagged = np.bincount(
+            group_codes,
+            weights=y_values * is_flagged,
+            minlength=n_groups,
+        )
+
+        summary = pd.DataFrame(
+            {name: values[first_row] for name, values in keys.items()},
+        )
+        summary["n_units"] = np.bincount(group_codes, minlength=n_groups)
+        summary["n_checked"] = n_checked.astype(int)
+        summary["n_flagged"] = n_flagged.astype(int)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            summary["flag_rate"] = n_flagged / n_checked
+            summary[f"{y_var}_total"] = y_total
+            summary[f"{y_var}_flagged"] = y_flagged
+            summary["flagged_share"] = y_flagged / y_total
+        return summary
+
+    @staticmethod
+    def _scale_factors(
+        log10_diff: np.ndarray,
+        lower_bound: float,
+        upper_bound: float,
+        tolerance: float,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Find scale errors of any power of ten from the log10 differences.
+
+        Args:
+            log10_diff: Array of log10 differences to the previous period.
+            lower_bound: Float for the lower bound of powers that are scale errors.
+            upper_bound: Float for the upper bound of powers that are scale errors.
+            tolerance: Float for the allowed distance to the nearest power.
+
+        Returns:
+            Boolean array for differences within tolerance of a power of ten outside the bounds, and array with this power of ten as a factor, 1 for other differences and NaN for missing differences.
+        """
+        powers = np.rint(log10_diff)
+        is_scale = (np.abs(log10_diff - powers) <= tolerance) & (
+            (powers > upper_bound) | (powers < lower_bound)
+        )
+        factors = np.where(is_scale, 10**powers, 1.0)
+        factors[np.isnan(log10_diff)] = np.nan
+        return is_scale, factors
+
     def thousand_error(
         self,
         y_var: str,
@@ -164,6 +1034,13 @@ class Detect:
         impute: bool = False,
         impute_var: str = "",
         output_format: str = "data",
+        strata_var: str = "",
+        score: str = "score_thousand",
+        top_k: int | None = None,
+        top_k_by: str = "",
+        scale_error: bool = False,
+        scale_tolerance: float = 0.2,
+        scale_var: str = "scale_factor",
     ) -> pd.DataFrame:
         """Detect thousand errors based on a previous period.
 
@@ -173,12 +1050,19 @@ class Detect:
             lower_bound: Float variable for the lower bound log factor for defining an outlier.
             upper_bound: Float variable for the upper bound log factor for defining an outlier.
             flag: String for the name of the flag variable to add to the data. Default is 'flag_thousand'.
-            impute: Boolean for whether to impute the flagged observations. Default is False.
+            impute: Boolean for whether to impute the flagged observations by dividing by 1000, or by the scale factor if scale_error is True. Default is False.
             impute_var: String for the name of the imputed variable.
-            output_format: String for whether to return a data frame 'data', or just the identified outlier units 'outliers'.
+            output_format: String for whether to return a data frame 'data', just the identified outlier units 'outliers', or flag counts and flagged totals for each time period 'summary'.
+            strata_var: String variable for stratification of the 'summary' output. Default is blank ("").
+            score: String for the name of the score variable. The score is the absolute log10 difference to the previous period. Default is 'score_thousand'.
+            top_k: Integer for the number of most suspicious units to return. Each unit is returned once, with its highest scoring period, ordered by descending score. Overrides output_format when given.
+            top_k_by: String variable, for example a stratum, to return the top_k units within. Default is blank ("").
+            scale_error: Boolean for whether to detect scale errors of any power of ten. A difference is flagged if it is within scale_tolerance of a whole power of ten outside lower_bound and upper_bound, for example 100 or 0.001 with bounds of -1.5 and 1.5. Default is False.
+            scale_tolerance: Float for the allowed log10 distance to the nearest power of ten when scale_error is True. Default is 0.2.
+            scale_var: String for the name of the scale factor variable added when scale_error is True. The factor is the power of ten for flagged observations and 1 for other checked observations. Default is 'scale_factor'.
 
         Returns:
-            Data frame containing a flag variable for identified outliers or a dataframe containing only the outliers.
+            Data frame containing a flag variable for identified outliers or a dataframe containing only the outliers. For Dask data a Dask dataframe is returned, and top_k and 'summary' are not supported.
         """
         # Check data
         self._check_data(self.data, y_var=y_var, time_var=time_var)
@@ -188,38 +1072,110 @@ class Detect:
             mes = f"No impute variable given so using {impute_var}"
             self.logger.info(mes)
 
-        # Find differences by sorting first - not efficient but works
-        data = self.data.sort_values(by=[self.id_nr, time_var]).reset_index(drop=True)
-        log10_diff = data.groupby(self.id_nr)[y_var].transform(
-            lambda x: np.log10(x).diff(),
+        if self._is_dask:
+            output: pd.DataFrame = self._map_units(
+                "thousand_error",
+                [
+                    flag,
+                    score,
+                    *([scale_var] if scale_error else []),
+                    *([impute_var] if impute else []),
+                ],
+                y_var=y_var,
+                time_var=time_var,
+                lower_bound=lower_bound,
+                upper_bound=upper_bound,
+                flag=flag,
+                impute=impute,
+                impute_var=impute_var,
+                output_format=output_format,
+                strata_var=strata_var,
+                score=score,
+                top_k=top_k,
+                top_k_by=top_k_by,
+                scale_error=scale_error,
+                scale_tolerance=scale_tolerance,
+                scale_var=scale_var,
+            )
+            return output
+
+        # Find differences to the previous period within each unit
+        panel = self._sort_panel(time_var)
+        order, unit_codes, unit_starts = (
+            panel.order,
+            panel.unit_codes,
+            panel.unit_starts,
         )
+        y = panel.data[y_var].to_numpy(dtype=float)[order]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log10_y = np.log10(y)
+            log10_diff = np.empty_like(log10_y)
+            log10_diff[1:] = log10_y[1:] - log10_y[:-1]
+        log10_diff[unit_starts] = np.nan
+
+        # set flag for first periods to NA and flag outliers
+        mask_na = np.isnan(log10_diff)
+        if scale_error:
+            mask_outlier, scale_values = self._scale_factors(
+                log10_diff,
+                lower_bound,
+                upper_bound,
+                scale_tolerance,
+            )
+        else:
+            mask_outlier = (log10_diff > upper_bound) | (log10_diff < lower_bound)
+        flag_values = np.where(mask_na, np.nan, 0.0)
+        flag_values[mask_outlier] = 1
+        score_values = np.abs(log10_diff)
+
+        # Return the most suspicious units or a summary only
+        if top_k is not None:
+            rows = self._top_k_units(
+                unit_codes,
+                unit_starts,
+                score_values,
+                top_k,
+                panel.data[top_k_by].to_numpy()[order] if top_k_by else None,
+            )
+            output = panel.data.iloc[order[rows]].copy()
+            output[flag] = flag_values[rows]
+            output[score] = score_values[rows]
+            if scale_error:
+                output[scale_var] = scale_values[rows]
+            return output
+        if output_format == "summary":
+            keys = [strata_var, time_var] if strata_var else [time_var]
+            return self._summarize_flags(
+                flag_values,
+                y,
+                {key: panel.data[key].to_numpy()[order] for key in keys},
+                y_var,
+            )
 
-        # set flag for first periods to NA
-        data[flag] = 0
-        mask_na = log10_diff.isna()
-        data.loc[mask_na, flag] = np.nan
-
-        # set flag for outlier
-        mask_outlier = (log10_diff > upper_bound) | (log10_diff < lower_bound)
-        data.loc[mask_outlier, flag] = 1
+        data = panel.data.iloc[order].reset_index(drop=True)
+        data[flag] = flag_values
+        data[score] = score_values
+        if scale_error:
+            data[scale_var] = scale_values
 
         # Impute
         if impute:
             data[impute_var] = data[y_var].copy()
-            data.loc[mask_outlier, impute_var] = data.loc[mask_outlier, y_var] / 1000
+            data.loc[mask_outlier, impute_var] = data.loc[mask_outlier, y_var] / (
+                scale_values[mask_outlier] if scale_error else 1000
+            )
 
         # return data if output_format is data
         if output_format == "data":
-            output: pd.DataFrame = data
+            output = data
 
         # select outlier units and return only them if output_format is outliers
         elif output_format == "outliers":
-            outlier_ids = data.loc[mask_outlier, self.id_nr]
-            mask_outlier_units = data[self.id_nr].isin(outlier_ids)
+            mask_outlier_units = np.isin(unit_codes, unit_codes[mask_outlier])
             output = data.loc[mask_outlier_units, :]
         else:
             output = data
-            mes = "output_format is not valid. Use 'data' or 'outliers'. Returning 'data' format."
+            mes = "output_format is not valid. Use 'data', 'outliers' or 'summary'. Returning 'data' format."
             self.logger.warning(mes)
 
         return output
@@ -232,7 +1188,12 @@ class Detect:
         flag: str = "flag_accumulation",
         impute: bool = False,
         impute_var: str = "",
+        impute_weight: str = "",
         output_format: str = "data",
+        strata_var: str = "",
+        score: str = "score_accumulation",
+        top_k: int | None = None,
+        top_k_by: str = "",
     ) -> pd.DataFrame:
         """Detect accumulation errors based on a previous periods.
 
@@ -241,12 +1202,17 @@ class Detect:
             time_var: String variable for indicating the time period. This should be in a ISO 8601 standard format for example: 'YYYY', 'YYYY-MM', 'YYYY-MM-DD' or a SSB standard like 'YYYY-Qq'.
             error: Float for the allowed error factor.
             flag: String for the name of the flag variable to add to the data. Default is 'flag_thousand'.
-            impute: Boolean for whether to impute the flagged observations. Default is False. (NOT IMPLEMENTED)
+            impute: Boolean for whether to impute the flagged observations. Default is False. A flagged value following one or more missing or zero periods is spread back over these periods, if the unit has a reported value before them.
             impute_var: String for the name of the imputed variable.
-            output_format: String for whether to return a data frame 'data', or just the identified outlier units 'outliers'.
+            impute_weight: String variable, for example number of employees, to spread accumulated values proportionally to. Default is blank ("") which spreads values evenly.
+            output_format: String for whether to return a data frame 'data', just the identified outlier units 'outliers', or flag counts and flagged totals for each time period 'summary'.
+            strata_var: String variable for stratification of the 'summary' output. Default is blank ("").
+            score: String for the name of the score variable. The score is the growth from the previous period in excess of the allowed error. Default is 'score_accumulation'.
+            top_k: Integer for the number of most suspicious units to return. Each unit is returned once, with its highest scoring period, ordered by descending score. Overrides output_format when given.
+            top_k_by: String variable, for example a stratum, to return the top_k units within. Default is blank ("").
 
         Returns:
-            Data frame containing a flag variable for identified outliers or a dataframe containing only the outliers.
+            Data frame containing a flag variable for identified outliers or a dataframe containing only the outliers. For Dask data a Dask dataframe is returned, and top_k and 'summary' are not supported.
         """
         # Check data
         self._check_data(self.data, y_var=y_var, time_var=time_var)
@@ -256,26 +1222,85 @@ class Detect:
             mes = f"No imputed variable name given so {impute_var} is being used"
             self.logger.info(mes)
 
+        if self._is_dask:
+            output: pd.DataFrame = self._map_units(
+                "accumulation_error",
+                [flag, score, impute_var] if impute else [flag, score],
+                y_var=y_var,
+                time_var=time_var,
+                error=error,
+                flag=flag,
+                impute=impute,
+                impute_var=impute_var,
+                impute_weight=impute_weight,
+                output_format=output_format,
+                strata_var=strata_var,
+                score=score,
+                top_k=top_k,
+                top_k_by=top_k_by,
+            )
+            return output
+
         # Sort and get previous period data
-        data = self.data.sort_values(by=[self.id_nr, time_var]).reset_index(drop=True)
-        expected_turnover = data.groupby(self.id_nr)[y_var].shift(1)
+        panel = self._sort_panel(time_var)
+        order, unit_codes, unit_starts = (
+            panel.order,
+            panel.unit_codes,
+            panel.unit_starts,
+        )
+        y = panel.data[y_var].to_numpy(dtype=float)[order]
+        expected_turnover = np.empty_like(y)
+        expected_turnover[1:] = y[:-1]
+        expected_turnover[unit_starts] = np.nan
 
         # Set flag variable and set Nas
-        data[flag] = 0
-        mask_na = expected_turnover.isna()
-        data.loc[mask_na, flag] = np.nan
+        mask_na = np.isnan(expected_turnover)
+        mask_accum = y > expected_turnover * (1 + error)
+        flag_values = np.where(mask_na, np.nan, 0.0)
+        flag_values[mask_accum] = 1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score_values = y / expected_turnover - (1 + error)
+
+        # Return the most suspicious units or a summary only
+        if top_k is not None:
+            rows = self._top_k_units(
+                unit_codes,
+                unit_starts,
+                score_values,
+                top_k,
+                panel.data[top_k_by].to_numpy()[order] if top_k_by else None,
+            )
+            output = panel.data.iloc[order[rows]].copy()
+            output[flag] = flag_values[rows]
+            output[score] = score_values[rows]
+            return output
+        if output_format == "summary":
+            keys = [strata_var, time_var] if strata_var else [time_var]
+            return self._summarize_flags(
+                flag_values,
+                y,
+                {key: panel.data[key].to_numpy()[order] for key in keys},
+                y_var,
+            )
 
-        # set flag variable
-        mask_accum = data[y_var] > expected_turnover * (1 + error)
-        data.loc[mask_accum, flag] = 1
+        data = panel.data.iloc[order].reset_index(drop=True)
+        data[flag] = flag_values
+        data[score] = score_values
 
-        # Impute - not implemented
+        # Impute by spreading flagged values over the preceding gap periods
         if impute:
-            mes = "Imputation not implemented for this method."
-            self.logger.error(mes)
+            weight = (
+                data[impute_weight].to_numpy(dtype=float) if impute_weight else None
+            )
+            data[impute_var] = self._spread_accumulation(
+                y,
+                unit_codes,
+                flag_values == 1,
+                weight,
+            )
 
         if output_format == "data":
-            output: pd.DataFrame = data
+            output = data
         elif output_format == "outliers":
             flagged_ids = (
                 data.groupby(self.id_nr)[flag]
@@ -288,20 +1313,74 @@ class Detect:
             mask_units = data[self.id_nr].isin(ids_with_flag_all_periods)
             output = data.loc[mask_units, :]
         else:
-            self.logger.warning("output_format is not valid. Use 'data' or 'outliers'")
+            output = data
+            self.logger.warning(
+                "output_format is not valid. Use 'data', 'outliers' or 'summary'",
+            )
 
         return output
 
     @staticmethod
-    def _calculate_hb(
+    def _spread_accumulation(
+        y: np.ndarray,
+        unit_codes: np.ndarray,
+        is_flagged: np.ndarray,
+        weight: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """Spread flagged accumulated values back over the preceding missing or zero periods.
+
+        Each gap row (missing or zero) belongs to the next reported value within the same unit. Flagged reported values with a gap before them are divided between themselves and their gap rows, evenly or proportionally to the weight. Gaps before the first reported value or after the last reported value of a unit are left as they are.
+
+        Args:
+            y: Array of values sorted by unit and time.
+            unit_codes: Unit code for each row in y.
+            is_flagged: Boolean array for the rows flagged as accumulation errors.
+            weight: Optional array of weights for each row in y.
+
+        Returns:
+            Array with imputed values.
+        """
+        n = len(y)
+        is_gap = np.isnan(y) | (y == 0)
+
+        # Find the next reported row for each row using a reversed cumulative minimum
+        next_reported = np.where(is_gap, n, np.arange(n))
+        owner = np.minimum.accumulate(next_reported[::-1])[::-1]
+        has_owner = owner < n
+        has_owner[has_owner] = unit_codes[owner[has_owner]] == unit_codes[has_owner]
+
+        # Gaps before the first reported value of the unit are not filled
+        last_reported = np.maximum.accumulate(np.where(is_gap, -1, np.arange(n)))
+        has_owner &= last_reported >= 0
+        has_owner[has_owner] = (
+            unit_codes[last_reported[has_owner]] == unit_codes[has_owner]
+        )
+        owner = np.where(has_owner, owner, np.arange(n))
+
+        # Only blocks with gaps and a flagged positive accumulated value are imputed
+        block_size = np.bincount(owner, minlength=n)
+        in_block = (block_size[owner] > 1) & (y[owner] > 0) & is_flagged[owner]
+
+        if weight is None:
+            weight = np.ones(n)
+        block_weight = np.bincount(owner, weights=weight, minlength=n)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            share = weight / block_weight[owner]
+        use_even = ~np.isfinite(block_weight[owner]) | (block_weight[owner] <= 0)
+        share = np.where(use_even, 1 / block_size[owner], share)
+
+        return np.where(in_block, y[owner] * share, y)
+
+    @staticmethod
+    def _hb_parameters(
         x1: pd.Series,
         x2: pd.Series,
         pu: float,
         pa: float,
         pc: float,
         percentiles: tuple[float, float],
-    ) -> pd.DataFrame:
-        """Calculate HB method."""
+    ) -> tuple[float, float, float]:
+        """Calculate the median ratio and the lower and upper effect limits for HB."""
         rat = x1 / x2
         med_ratio = rat.median()
         s_ratio = np.where(
@@ -322,111 +1401,123 @@ class Detect:
         else:
             ell = q2 - pc * max(q2 - q1, pa)
             eul = q2 + pc * max(q3 - q2, pa)
+        return med_ratio, ell, eul
 
+    @staticmethod
+    def _hb_limits(
+        x1: pd.Series,
+        x2: pd.Series,
+        med_ratio: Any,
+        ell: Any,
+        eul: Any,
+        pu: float,
+    ) -> pd.DataFrame:
+        """Calculate the HB limits for the ratio from the median ratio and effect limits."""
+        max_y = pd.concat([x1, x2], axis=1).max(axis=1)
         lower_limit = med_ratio * max_y**pu / (max_y**pu - ell)
         upper_limit = med_ratio * (max_y**pu + eul) / max_y**pu
 
         return pd.DataFrame({"lower_limit": lower_limit, "upper_limit": upper_limit})
 
-    def hb(
-        self,
-        y_var: str,
-        time_var: str,
-        time_periods: list[str] | None = None,
-        strata_var: str = "",
-        pu: float = 0.5,
-        pa: float = 0.05,
-        pc: float = 20,
-        percentiles: tuple[float, float] = (0.25, 0.75),
-        flag: str = "flag_hb",
-        output_format: str = "wide",
+    @staticmethod
+    def _calculate_hb(
+        x1: pd.Series,
+        x2: pd.Series,
+        pu: float,
+        pa: float,
+        pc: float,
+        percentiles: tuple[float, float],
     ) -> pd.DataFrame:
-        """Outlier detection using the Hidiroglou-Berthelot (HB) method.
+        """Calculate HB method."""
+        med_ratio, ell, eul = Detect._hb_parameters(x1, x2, pu, pa, pc, percentiles)
+        return Detect._hb_limits(x1, x2, med_ratio, ell, eul, pu)
 
-        Detects possible outliers of a variable in period t by comparing it with values from period t-1.
+    def _select_periods(
+        self,
+        data: pd.DataFrame,
+        time_var: str,
+        time_periods: list[str] | None,
+    ) -> tuple[pd.DataFrame, np.ndarray]:
+        """Filter the data to the two time periods to compare.
 
         Args:
-            y_var: String for the name of the variable of interest to check.
-            time_var: String variable for indicating the time period. This should be in a ISO 8601 standard format for example: 'YYYY', 'YYYY-MM', 'YYYY-MM-DD' or a SSB standard like 'YYYY-Qq'.
-            time_periods: List of strings for the two time periods to compare. Default None, in which case it is assumed that the time variable contains exactly two time preiods.
-            strata_var: String variable for stratification. Default is blank ("").
-            pu: Parameter that adjusts for different level of the variables. Default value 0.5.
-            pa: Parameter that adjusts for small differences between the median and the 1st or 3rd quartile. Default value 0.05.
-            pc: Parameter that controls the width of the confidence interval. Default value 20.
-            percentiles: Tuple for percentile values to use.
-            flag: String variable name to use to indicate outliers.
-            output_format: String for format to return. Can be 'wide','long','outliers'.
+            data: Data in long format.
+            time_var: String variable for indicating the time period.
+            time_periods: List of strings for the two time periods to compare, or None to use all periods.
 
         Returns:
-            Dataframe with flags or with identified units
+            The filtered data and the sorted time levels.
         """
-        # Check data
-        self._check_data(self.data, y_var=y_var, time_var=time_var)
-        data = self.data.copy()
-
-        # Add in check if number of companies in each strata is too low.
-
-        # Filter time periods
         if time_periods:
             if len(time_periods) != 2:
                 mes = "Two time periods should be specified."
                 self.logger.error(mes)
             data = data.loc[data[time_var].isin(time_periods), :]
 
-        # Get time levels
         time_levels = np.unique(data[time_var])
         if len(time_levels) != 2:
             mes = "The time variable must have exactly two unique levels."
             self.logger.error(mes)
-        time1 = time_levels[1]  # t
-        time0 = time_levels[0]  # t-1
-
-        # Convert to wide
-        wide_index = [self.id_nr, strata_var] if strata_var else self.id_nr
-        wide_data = data.pivot_table(
-            index=wide_index,
-            columns=time_var,
-            values=y_var,
-            aggfunc="first",
-        ).reset_index()
+        return data, time_levels
+
+    def _hb_pairs(
+        self,
+        data: pd.DataFrame,
+        y_var: str,
+        time_var: str,
+        strata_var: str | list[str],
+        time_levels: np.ndarray,
+    ) -> pd.DataFrame:
+        """Convert two periods to wide format with the ratio between them.
+
+        Args:
+            data: Data in long format for the two periods.
+            y_var: String for the name of the variable of interest.
+            time_var: String variable for indicating the time period.
+            strata_var: String variable or list of variables for stratification, or blank ("").
+            time_levels: The two time periods in sorted order.
+
+        Returns:
+            Data frame with one row per unit with values above 0 in both periods.
+        """
+        time0, time1 = time_levels[0], time_levels[1]
+        strata = [strata_var] if isinstance(strata_var, str) else strata_var
+        wide_index = [self.id_nr, *[col for col in strata if col]]
+        wide_data = (
+            data.pivot_table(
+                index=wide_index,
+                columns=time_var,
+                values=y_var,
+                aggfunc="first",
+            )
+            .reindex(columns=time_levels)
+            .reset_index()
+        )
         wide_data.columns.name = None
 
         # Check for valid rows
-        valid_rows = wide_data[(wide_data[time1] > 0) & (wide_data[time0] > 0)]
+        valid_rows: pd.DataFrame = wide_data[
+            (wide_data[time1] > 0) & (wide_data[time0] > 0)
+        ]
         if valid_rows.empty:
             mes = "No valid rows with y_var > 0 for both time periods."
             self.logger.error(mes)
 
         # Add in ratio
         valid_rows["ratio"] = valid_rows[time1] / valid_rows[time0]
+        return valid_rows
 
-        # Apply the HB function to each strata group
-        if strata_var:
-            limits = (
-                valid_rows.groupby(strata_var)
-                .apply(
-                    lambda group: self._calculate_hb(
-                        group[time1],
-                        group[time0],
-                        pu,
-                        pa,
-                        pc,
-                        percentiles,
-                    ),
-                )
-                .reset_index(level=strata_var, drop=True)
-            )
-        else:
-            limits = self._calculate_hb(
-                valid_rows[time1],
-                valid_rows[time0],
-                pu,
-                pa,
-                pc,
-                percentiles,
-            )
-
-        # Merge the limits back into the valid_rows
+    @staticmethod
+    def _add_hb_flags(
+        valid_rows: pd.DataFrame,
+        limits: pd.DataFrame,
+        time_levels: np.ndarray,
+        pu: float,
+        flag: str,
+        score: str,
+    ) -> pd.DataFrame:
+        """Merge the HB limits into the data and add the flag and score variables."""
+        time0, time1 = time_levels[0], time_levels[1]
         valid_rows = valid_rows.merge(
             limits,
             left_index=True,
@@ -442,9 +1533,475 @@ class Detect:
             0,
         )
 
+        # Add in score as the scaled distance outside the limits
+        max_y_pu = np.maximum(valid_rows[time1], valid_rows[time0]) ** pu
+        valid_rows[score] = max_y_pu * np.maximum(
+            np.maximum(
+                valid_rows["lower_limit"] - valid_rows["ratio"],
+                valid_rows["ratio"] - valid_rows["upper_limit"],
+            ),
+            0,
+        )
+        return valid_rows
+
+    def _hb_partition(
+        self,
+        y_var: str,
+        time_var: str,
+        strata_var: str,
+        time_levels: np.ndarray,
+    ) -> pd.DataFrame:
+        """Convert two periods to wide format for hb in one partition of Dask data."""
+        self._check_data(self.data, y_var=y_var, time_var=time_var)
+        data = self._sort_panel(time_var).data
+        data = data.loc[data[time_var].isin(time_levels), :]
+        valid_rows = self._hb_pairs(data, y_var, time_var, strata_var, time_levels)
+        return valid_rows.astype({time_levels[0]: float, time_levels[1]: float})
+
+    @staticmethod
+    def _hb_group_parameters(
+        group: pd.DataFrame,
+        time_levels: np.ndarray,
+        parameters: tuple[float, float, float, tuple[float, float]],
+    ) -> pd.Series:
+        """Calculate the median ratio and the effect limits for HB for one stratum."""
+        pu, pa, pc, percentiles = parameters
+        return pd.Series(
+            Detect._hb_parameters(
+                group[time_levels[1]],
+                group[time_levels[0]],
+                pu,
+                pa,
+                pc,
+                percentiles,
+            ),
+            index=["med_ratio", "ell", "eul"],
+        )
+
+    @staticmethod
+    def _hb_flag_partition(
+        part: pd.DataFrame,
+        limits: pd.DataFrame,
+        strata_var: str,
+        time_levels: np.ndarray,
+        pu: float,
+        flag: str,
+        score: str,
+    ) -> pd.DataFrame:
+        """Add the HB limits, flag and score to one partition of Dask data."""
+        if strata_var:
+            unit_limits = limits.reindex(part[strata_var])
+        else:
+            unit_limits = limits.iloc[np.zeros(len(part), dtype=int)]
+        ratio_limits = Detect._hb_limits(
+            part[time_levels[1]],
+            part[time_levels[0]],
+            unit_limits["med_ratio"].to_numpy(),
+            unit_limits["ell"].to_numpy(),
+            unit_limits["eul"].to_numpy(),
+            pu,
+        )
+        return Detect._add_hb_flags(part, ratio_limits, time_levels, pu, flag, score)
+
+    def _hb_partitioned(
+        self,
+        y_var: str,
+        time_var: str,
+        time_periods: list[str] | None,
+        strata_var: str,
+        parameters: tuple[float, float, float, tuple[float, float]],
+        flag: str,
+        score: str,
+    ) -> Any:
+        """Run hb on Dask data in two stages.
+
+        The units are put in wide format within each partition. The limits for each stratum are then calculated from all units, and the units are flagged within each partition using these limits.
+
+        Args:
+            y_var: String for the name of the variable of interest to check.
+            time_var: String variable for indicating the time period.
+            time_periods: List of strings for the two time periods to compare, or None to use all periods.
+            strata_var: String variable for stratification, or blank ("").
+            parameters: Tuple with pu, pa, pc and percentiles.
+            flag: String variable name to use to indicate outliers.
+            score: String for the name of the score variable.
+
+        Returns:
+            Dask dataframe in the 'wide' format.
+        """
+        data = self._partition_units()
+        if time_periods:
+            if len(time_periods) != 2:
+                mes = "Two time periods should be specified."
+                self.logger.error(mes)
+            time_levels = np.unique(time_periods)
+        else:
+            time_levels = np.unique(data[time_var].unique().compute())
+        if len(time_levels) != 2:
+            mes = "The time variable must have exactly two unique levels."
+            self.logger.error(mes)
+
+        # Put the two periods side by side within each partition
+        keys = [self.id_nr, strata_var] if strata_var else [self.id_nr]
+        meta = self._dask_meta(data)[keys]
+        for col in [*time_levels, "ratio"]:
+            meta[col] = pd.Series(dtype=float)
+        pairs = data.map_partitions(
+            self._run_partition,
+            meta,
+            self.id_nr,
+            self.duplicates,
+            logging.getLevelName(self.logger.level).lower(),
+            "_hb_partition",
+            {
+                "y_var": y_var,
+                "time_var": time_var,
+                "strata_var": strata_var,
+                "time_levels": time_levels,
+            },
+            meta=meta,
+        ).persist()
+
+        # Stage 1: limits for each stratum from all units
+        limits_meta = {"med_ratio": float, "ell": float, "eul": float}
+        if strata_var:
+            limits = (
+                pairs.groupby(strata_var)
+                .apply(
+                    self._hb_group_parameters,
+                    time_levels,
+                    parameters,
+                    meta=limits_meta,
+                )
+                .compute()
+            )
+        else:
+            limits = (
+                self._hb_group_parameters(
+                    pairs[list(time_levels)].compute(),
+                    time_levels,
+                    parameters,
+                )
+                .to_frame()
+                .T
+            )
+
+        # Stage 2: flag the units within each partition
+        meta["lower_limit"] = pd.Series(dtype=float)
+        meta["upper_limit"] = pd.Series(dtype=float)
+        meta[flag] = pd.Series(dtype=int)
+        meta[score] = pd.Series(dtype=float)
+        return pairs.map_partitions(
+            self._hb_flag_partition,
+            limits,
+            strata_var,
+            time_levels,
+            parameters[0],
+            flag,
+            score,
+            meta=meta,
+        )
+
+    @staticmethod
+    def _hb_table(
+        valid_rows: pd.DataFrame,
+        levels: list[list[str]],
+        time_levels: np.ndarray,
+        parameters: tuple[float, float, float, tuple[float, float]],
+    ) -> pd.DataFrame:
+        """Calculate the HB parameters for each stratum at each level.
+
+        The rows are repeated for each level so the quantiles for all strata at all levels are calculated together.
+
+        Args:
+            valid_rows: Data in wide format with one row per unit.
+            levels: List of levels, each a list of the strata variables defining the level. An empty list is a level with all units.
+            time_levels: The two time periods in sorted order.
+            parameters: Tuple with pu, pa, pc and percentiles.
+
+        Returns:
+            Data frame with the strata variables, the level, the number of units, the median ratio and the lower and upper effect limits for each stratum.
+        """
+        n_rows = len(valid_rows)
+        group_codes = []
+        strata = []
+        n_groups = 0
+        for level in levels:
+            if level:
+                codes = valid_rows.groupby(level, sort=False).ngroup().to_numpy()
+                stratum = valid_rows[level].drop_duplicates(ignore_index=True)
+            else:
+                codes, stratum = np.zeros(n_rows, dtype=int), pd.DataFrame(index=[0])
+            stratum["strata_level"] = level[-1] if level else "total"
+            group_codes.append(codes + n_groups)
+            strata.append(stratum)
+            n_groups += len(stratum)
+
+        values, counts = Detect._grouped_hb_parameters(
+            np.tile(valid_rows[time_levels[1]].to_numpy(dtype=float), len(levels)),
+            np.tile(valid_rows[time_levels[0]].to_numpy(dtype=float), len(levels)),
+            np.concatenate(group_codes),
+            n_groups,
+            *parameters,
+        )
+        table: pd.DataFrame = pd.concat(strata, ignore_index=True)
+        table["n_units"] = counts
+        table["med_ratio"] = values[:, 0]
+        table["ell"] = values[:, 1]
+        table["eul"] = values[:, 2]
+        return table
+
+    @staticmethod
+    def _apply_hb_table(
+        valid_rows: pd.DataFrame,
+        table: pd.DataFrame,
+        levels: list[list[str]],
+        time_levels: np.ndarray,
+        min_units: int,
+        pu: float,
+    ) -> pd.DataFrame:
+        """Calculate the HB limits for each unit from the parameters of its stratum.
+
+        Each unit gets the parameters of the first level where its stratum has at least min_units units, or of the last level.
+
+        Args:
+            valid_rows: Data in wide format with one row per unit.
+            table: Data frame from _hb_table.
+            levels: List of levels from the finest to the coarsest, as for _hb_table.
+            time_levels: The two time periods in sorted order.
+            min_units: Integer for the minimum number of units in a stratum.
+            pu: Parameter that adjusts for different level of the variables.
+
+        Returns:
+            Data frame with the lower and upper limit and the level used for each unit.
+        """
+        n_rows = len(valid_rows)
+        table_levels = table["strata_level"].to_numpy()
+        positions = np.full((len(levels), n_rows), -1)
+        for i, level in enumerate(levels):
+            level_rows = np.flatnonzero(
+                table_levels == (level[-1] if level else "total"),
+            )
+            if level:
+                found = pd.MultiIndex.from_frame(
+                    table.iloc[level_rows][level],
+                ).get_indexer(
+                    pd.MultiIndex.from_frame(valid_rows[level]),
+                )
+            else:
+                found = np.zeros(n_rows, dtype=int)
+            positions[i, found >= 0] = level_rows[found[found >= 0]]
+
+        # Use the first level with enough units, and the last level otherwise
+        n_units = np.append(table["n_units"].to_numpy(), 0)
+        is_large = (positions >= 0) & (n_units[positions] >= min_units)
+        is_large[-1] = True
+        level_used = np.argmax(is_large, axis=0)
+        rows = positions[level_used, np.arange(n_rows)]
+
+        values = np.vstack(
+            [
+                table[["med_ratio", "ell", "eul"]].to_numpy(dtype=float),
+                np.full(3, np.nan),
+            ],
+        )[rows]
+        limits = Detect._hb_limits(
+            valid_rows[time_levels[1]],
+            valid_rows[time_levels[0]],
+            values[:, 0],
+            values[:, 1],
+            values[:, 2],
+            pu,
+        )
+        limits["strata_level"] = np.array([*table_levels, None], dtype=object)[rows]
+        return limits
+
+    def _strata_hb_limits(
+        self,
+        valid_rows: pd.DataFrame,
+        y_var: str,
+        time_var: str,
+        strata_var: str | list[str],
+        time_levels: np.ndarray,
+        min_units: int,
+        parameters: tuple[float, float, float, tuple[float, float]],
+    ) -> pd.DataFrame:
+        """Calculate the HB limits for each unit within its stratum.
+
+        The parameters for each stratum are cached for each set of arguments, and saved with the panel by save.
+
+        Args:
+            valid_rows: Data in wide format with one row per unit.
+            y_var: String for the name of the variable of interest.
+            time_var: String variable for indicating the time period.
+            strata_var: String variable or list of hierarchical variables for stratification, or blank ("").
+            time_levels: The two time periods in sorted order.
+            min_units: Integer for the minimum number of units in a stratum when strata_var is a list.
+            parameters: Tuple with pu, pa, pc and percentiles.
+
+        Returns:
+            Data frame with the lower and upper limit for each unit, and the level used if strata_var is a list.
+        """
+        is_hierarchical = isinstance(strata_var, list)
+        if isinstance(strata_var, list):
+            levels = [strata_var[:k] for k in range(len(strata_var), -1, -1)]
+        else:
+            levels = [[strata_var]] if strata_var else [[]]
+
+        key = json.dumps(
+            {
+                "y_var": y_var,
+                "time_var": time_var,
+                "time_levels": [str(level) for level in time_levels],
+                "strata_var": strata_var,
+                "parameters": parameters,
+            },
+        )
+        with self._panel_lock:
+            cached = self._hb_tables.get(key)
+            if cached is None or cached[0] is not self.data:
+                table = self._hb_table(valid_rows, levels, time_levels, parameters)
+                cached = (self.data, table)
+                self._hb_tables[key] = cached
+
+        limits = self._apply_hb_table(
+            valid_rows,
+            cached[1],
+            levels,
+            time_levels,
+            min_units if is_hierarchical else 0,
+            parameters[0],
+        )
+        if not is_hierarchical:
+            limits = limits.drop(columns="strata_level")
+        return limits
+
+    def hb(
+        self,
+        y_var: str,
+        time_var: str,
+        time_periods: list[str] | None = None,
+        strata_var: str | list[str] = "",
+        pu: float = 0.5,
+        pa: float = 0.05,
+        pc: float = 20,
+        percentiles: tuple[float, float] = (0.25, 0.75),
+        flag: str = "flag_hb",
+        output_format: str = "wide",
+        score: str = "score_hb",
+        top_k: int | None = None,
+        top_k_by: str = "",
+        min_units: int = 10,
+    ) -> pd.DataFrame:
+        """Outlier detection using the Hidiroglou-Berthelot (HB) method.
+
+        Detects possible outliers of a variable in period t by comparing it with values from period t-1.
+
+        Args:
+            y_var: String for the name of the variable of interest to check.
+            time_var: String variable for indicating the time period. This should be in a ISO 8601 standard format for example: 'YYYY', 'YYYY-MM', 'YYYY-MM-DD' or a SSB standard like 'YYYY-Qq'.
+            time_periods: List of strings for the two time periods to compare. Default None, in which case it is assumed that the time variable contains exactly two time preiods.
+            strata_var: String variable for stratification, or a list of hierarchical strata variables from the coarsest to the finest, for example ['nace2', 'nace5']. With a list, each unit gets the limits of the finest stratum with at least min_units units, or of all units if no stratum is large enough. Default is blank ("").
+            pu: Parameter that adjusts for different level of the variables. Default value 0.5.
+            pa: Parameter that adjusts for small differences between the median and the 1st or 3rd quartile. Default value 0.05.
+            pc: Parameter that controls the width of the confidence interval. Default value 20.
+            percentiles: Tuple for percentile values to use.
+            flag: String variable name to use to indicate outliers.
+            output_format: String for format to return. Can be 'wide','long','outliers' or 'summary' for flag counts and flagged totals for each stratum.
+            score: String for the name of the score variable. The score is the distance of the ratio outside the limits, scaled by max_y**pu. Default is 'score_hb'.
+            top_k: Integer for the number of most suspicious units to return, ordered by descending score. Overrides output_format when given.
+            top_k_by: String variable, for example the strata_var, to return the top_k units within. Other variables are taken from period t and added to the output. Default is blank ("").
+            min_units: Integer for the minimum number of units in a stratum for using its limits when strata_var is a list. The variable 'strata_level' shows the strata variable for the stratum used, or 'total' for all units. Default is 10.
+
+        Returns:
+            Dataframe with flags or with identified units. For Dask data a Dask dataframe is returned, and only the 'wide' and 'outliers' formats are supported.
+
+        Raises:
+            ValueError: If top_k, an output format other than 'wide' or 'outliers', or a list of strata variables is used with Dask data.
+        """
+        # Check data
+        self._check_data(self.data, y_var=y_var, time_var=time_var)
+        strata = [strata_var] if isinstance(strata_var, str) else strata_var
+        for col in [*strata, top_k_by]:
+            if col and col not in self.data.columns:
+                mes = f"Missing column: {col}"
+                raise ValueError(mes)
+        if self._is_dask:
+            if (
+                top_k is not None
+                or output_format not in ("wide", "outliers")
+                or isinstance(strata_var, list)
+            ):
+                mes = "For Dask data hb supports output_format 'wide' or 'outliers' and one strata_var. Use .compute() to get a pandas dataframe first."
+                raise ValueError(mes)
+            output: pd.DataFrame = self._hb_partitioned(
+                y_var,
+                time_var,
+                time_periods,
+                strata_var,
+                (pu, pa, pc, percentiles),
+                flag,
+                score,
+            )
+            if output_format == "outliers":
+                output = output.loc[output[flag] == 1]
+            return output
+        data = self._sort_panel(time_var).data.copy()
+
+        # Filter time periods and get time levels
+        data, time_levels = self._select_periods(data, time_var, time_periods)
+        time1 = time_levels[1]  # t
+
+        # Convert to wide with one row per unit with values in both periods
+        valid_rows = self._hb_pairs(data, y_var, time_var, strata_var, time_levels)
+
+        # Apply the HB function to each strata group
+        limits = self._strata_hb_limits(
+            valid_rows,
+            y_var,
+            time_var,
+            strata_var,
+            time_levels,
+            min_units,
+            (pu, pa, pc, percentiles),
+        )
+
+        # Merge the limits back into the valid_rows and add flag and score
+        valid_rows = self._add_hb_flags(
+            valid_rows,
+            limits,
+            time_levels,
+            pu,
+            flag,
+            score,
+        )
+
         # Format in correct output format
-        if output_format == "wide":
-            output: pd.DataFrame = valid_rows
+        if top_k is not None:
+            if top_k_by and top_k_by not in valid_rows.columns:
+                # Use the value of the unit in period t
+                latest = data.loc[data[time_var] == time1, :].set_index(self.id_nr)
+                valid_rows[top_k_by] = valid_rows[self.id_nr].map(latest[top_k_by])
+            groups = pd.factorize(valid_rows[top_k_by])[0] if top_k_by else None
+            rows = self._top_k(valid_rows[score].to_numpy(), top_k, groups)
+            output = valid_rows.iloc[rows]
+        elif output_format == "summary":
+            keys = [*[col for col in strata if col], time_var]
+            output = self._summarize_flags(
+                valid_rows[flag].to_numpy(dtype=float),
+                valid_rows[time1].to_numpy(dtype=float),
+                {
+                    key: (
+                        np.full(len(valid_rows), time1)
+                        if key == time_var
+                        else valid_rows[key].to_numpy()
+                    )
+                    for key in keys
+                },
+                y_var,
+            )
+        elif output_format == "wide":
+            output = valid_rows
         elif output_format == "outliers":
             mask_units = valid_rows[flag] == 1
             output = valid_rows.loc[mask_units, :]
@@ -452,16 +2009,565 @@ class Detect:
                 self.logger.info("No outliers detected")
         elif output_format == "long":
             output = valid_rows.melt(
-                id_vars=[self.id_nr, "ratio", "lower_limit", "upper_limit", flag],
+                id_vars=[
+                    self.id_nr,
+                    "ratio",
+                    "lower_limit",
+                    "upper_limit",
+                    flag,
+                    score,
+                ],
                 value_vars=time_levels,
                 var_name=time_var,
                 value_name=y_var,
             )
             mask = output[time_var] == time_levels[0]
-            output.loc[mask, ["lower_limit", "upper_limit", flag]] = np.nan
+            output.loc[mask, ["lower_limit", "upper_limit", flag, score]] = np.nan
         else:
-            mes = "output_format is not valid. Use 'wide', 'outliers' or 'long'. Wide being returned."
+            mes = "output_format is not valid. Use 'wide', 'outliers', 'long' or 'summary'. Wide being returned."
             self.logger.warning(mes)
             output = valid_rows
 
         return output
+
+    @staticmethod
+    def _ratio_panel(
+        data: pd.DataFrame,
+        pairs: list[tuple[str, str]],
+        time_var: str,
+        time_levels: np.ndarray,
+        wide_index: list[str],
+    ) -> tuple[pd.DataFrame, np.ndarray]:
+        """Calculate the ratios for all pairs of variables in two periods as one array.
+
+        Args:
+            data: Data in long format for the two periods, with one row per unit and period.
+            pairs: List of tuples with the numerator and denominator variable of each ratio.
+            time_var: String variable for indicating the time period.
+            time_levels: The two time periods in sorted order.
+            wide_index: List of the variables identifying a unit.
+
+        Returns:
+            Data frame with the wide_index variables for each unit, and array of ratios with one row per unit, one column per period and one layer per pair. Ratios are missing where the denominator is not above 0.
+        """
+        data = data.dropna(subset=wide_index)
+        grouped = data.groupby(wide_index, sort=True)
+        units = grouped.ngroup().to_numpy()
+        keys = grouped.size().index.to_frame(index=False)
+
+        variables = list(dict.fromkeys(var for pair in pairs for var in pair))
+        values = np.full((len(keys), 2, len(variables)), np.nan)
+        is_time1 = (data[time_var] == time_levels[1]).to_numpy(dtype=int)
+        values[units, is_time1] = data[variables].to_numpy(dtype=float, na_value=np.nan)
+
+        position = {var: j for j, var in enumerate(variables)}
+        numerators = values[:, :, [position[numerator] for numerator, _ in pairs]]
+        denominators = values[:, :, [position[denominator] for _, denominator in pairs]]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratios = np.where(denominators > 0, numerators / denominators, np.nan)
+        return keys, ratios
+
+    def hb_ratios(
+        self,
+        pairs: list[tuple[str, str]],
+        time_var: str,
+        time_periods: list[str] | None = None,
+        strata_var: str = "",
+        pu: float = 0.5,
+        pa: float = 0.05,
+        pc: float = 20,
+        percentiles: tuple[float, float] = (0.25, 0.75),
+        flag: str = "flag_hb",
+        output_format: str = "wide",
+        score: str = "score_hb",
+    ) -> dict[tuple[str, str], pd.DataFrame]:
+        """Outlier detection using the HB method for the ratios between many pairs of variables.
+
+        Each ratio, for example turnover per employee, is compared with the ratio in the previous period as in hb. The data is converted to wide format once for all variables, and the limits for all ratios and strata are calculated together.
+
+        Args:
+            pairs: List of tuples with the numerator and denominator variable of each ratio, for example [('turnover', 'employees'), ('wages', 'employees')].
+            time_var: String variable for indicating the time period. This should be in a ISO 8601 standard format for example: 'YYYY', 'YYYY-MM', 'YYYY-MM-DD' or a SSB standard like 'YYYY-Qq'.
+            time_periods: List of strings for the two time periods to compare. Default None, in which case it is assumed that the time variable contains exactly two time preiods.
+            strata_var: String variable for stratification. Default is blank ("").
+            pu: Parameter that adjusts for different level of the variables. Default value 0.5.
+            pa: Parameter that adjusts for small differences between the median and the 1st or 3rd quartile. Default value 0.05.
+            pc: Parameter that controls the width of the confidence interval. Default value 20.
+            percentiles: Tuple for percentile values to use.
+            flag: String variable name to use to indicate outliers.
+            output_format: String for format to return. Can be 'wide' or 'outliers'.
+            score: String for the name of the score variable, as in hb. Default is 'score_hb'.
+
+        Returns:
+            Dictionary with a data frame for each pair, in the same format as the 'wide' output of hb for a variable with the ratio. Ratios are missing where the denominator is not above 0.
+
+        Raises:
+            ValueError: If a variable is missing or not numeric.
+        """
+        # Check data
+        self._check_data(self.data, time_var=time_var)
+        for numerator, denominator in pairs:
+            self._check_data(self.data, y_var=numerator)
+            self._check_data(self.data, y_var=denominator)
+        if strata_var and strata_var not in self.data.columns:
+            mes = f"Missing column: {strata_var}"
+            raise ValueError(mes)
+        data = self._sort_panel(time_var).data
+
+        # Filter time periods and get time levels
+        data, time_levels = self._select_periods(data, time_var, time_periods)
+        wide_index = [self.id_nr, strata_var] if strata_var else [self.id_nr]
+        keys, ratios = self._ratio_panel(data, pairs, time_var, time_levels, wide_index)
+
+        # Only units with ratios above 0 in both periods are used
+        previous, current = ratios[:, 0], ratios[:, 1]
+        valid = (current > 0) & (previous > 0)
+        current = np.where(valid, current, np.nan)
+        previous = np.where(valid, previous, np.nan)
+
+        # Group by stratum and pair
+        n_units, n_pairs = current.shape
+        if strata_var:
+            strata, strata_index = pd.factorize(keys[strata_var])
+            n_strata = len(strata_index)
+        else:
+            strata, n_strata = np.zeros(n_units, dtype=int), 1
+        groups = (strata[:, None] * n_pairs + np.arange(n_pairs)).ravel()
+        lower_limit, upper_limit, _ = self._grouped_hb_limits(
+            current.ravel(),
+            previous.ravel(),
+            groups,
+            n_strata * n_pairs,
+            pu,
+            pa,
+            pc,
+            percentiles,
+        )
+        lower_limit = lower_limit.reshape(n_units, n_pairs)
+        upper_limit = upper_limit.reshape(n_units, n_pairs)
+        ratio = current / previous
+        flag_values = ((ratio < lower_limit) | (ratio > upper_limit)).astype(int)
+        max_y_pu = np.fmax(current, previous) ** pu
+        score_values = max_y_pu * np.maximum(
+            np.maximum(lower_limit - ratio, ratio - upper_limit),
+            0,
+        )
+
+        if output_format not in ("wide", "outliers"):
+            mes = "output_format is not valid. Use 'wide' or 'outliers'. Wide being returned."
+            self.logger.warning(mes)
+        output = {}
+        for j, pair in enumerate(pairs):
+            rows = valid[:, j]
+            if output_format == "outliers":
+                rows &= flag_values[:, j] == 1
+            frame = keys.loc[rows].reset_index(drop=True)
+            frame[time_levels[0]] = previous[rows, j]
+            frame[time_levels[1]] = current[rows, j]
+            frame["ratio"] = ratio[rows, j]
+            frame["lower_limit"] = lower_limit[rows, j]
+            frame["upper_limit"] = upper_limit[rows, j]
+            frame[flag] = flag_values[rows, j]
+            frame[score] = score_values[rows, j]
+            output[pair] = frame
+        return output
+
+    @staticmethod
+    def _grouped_quantiles(
+        groups: np.ndarray,
+        values: np.ndarray,
+        quantiles: list[float],
+        n_groups: int,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Calculate quantiles of values within each group using one sort.
+
+        Missing values are ignored. Quantiles use linear interpolation as in numpy and pandas.
+
+        Args:
+            groups: Array of integer group codes from 0 to n_groups - 1.
+            values: Array of values.
+            quantiles: List of quantiles to calculate.
+            n_groups: Number of groups.
+
+        Returns:
+            Array of quantiles with one row per group and one column per quantile, and the number of values in each group.
+        """
+        valid = ~np.isnan(values)
+        order = np.lexsort((values[valid], groups[valid]))
+        sorted_values = values[valid][order]
+        counts = np.bincount(groups[valid], minlength=n_groups)
+        starts = np.cumsum(counts) - counts
+
+        output = np.full((n_groups, len(quantiles)), np.nan)
+        has_values = counts > 0
+        n = counts[has_values]
+        for j, q in enumerate(quantiles):
+            virtual_index = (n - 1) * q
+            previous = np.floor(virtual_index).astype(int)
+            following = np.minimum(previous + 1, n - 1)
+            gamma = virtual_index - previous
+            a = sorted_values[starts[has_values] + previous]
+            b = sorted_values[starts[has_values] + following]
+            with np.errstate(invalid="ignore"):
+                output[has_values, j] = np.where(
+                    gamma >= 0.5,
+                    b - (b - a) * (1 - gamma),
+                    a + (b - a) * gamma,
+                )
+        return output, counts
+
+    @staticmethod
+    def _grouped_hb_parameters(
+        x1: np.ndarray,
+        x0: np.ndarray,
+        groups: np.ndarray,
+        n_groups: int,
+        pu: float,
+        pa: float,
+        pc: float,
+        percentiles: tuple[float, float],
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Calculate the median ratio and the effect limits for HB for all groups at once.
+
+        This gives the same values as _hb_parameters applied to each group. Rows with missing values are ignored.
+
+        Args:
+            x1: Array of values for period t.
+            x0: Array of values for period t-1.
+            groups: Array of integer group codes from 0 to n_groups - 1.
+            n_groups: Number of groups.
+            pu: Parameter that adjusts for different level of the variables.
+            pa: Parameter that adjusts for small differences between the median and the 1st or 3rd quartile.
+            pc: Parameter that controls the width of the confidence interval.
+            percentiles: Tuple for percentile values to use.
+
+        Returns:
+            Array with the median ratio and the lower and upper effect limits with one row per group, and the number of rows with values in each group.
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = x1 / x0
+            medians, counts = Detect._grouped_quantiles(groups, ratio, [0.5], n_groups)
+            med_ratio = medians[groups, 0]
+            s_ratio = np.where(
+                ratio >= med_ratio,
+                ratio / med_ratio - 1,
+                1 - med_ratio / ratio,
+            )
+            max_y_pu = np.fmax(x1, x0) ** pu
+            e_ratio = np.where(np.isnan(ratio), np.nan, s_ratio * max_y_pu)
+
+        quantiles, _ = Detect._grouped_quantiles(
+            groups,
+            e_ratio,
+            [percentiles[0], 0.5, percentiles[1]],
+            n_groups,
+        )
+        q1, q2, q3 = quantiles[:, 0], quantiles[:, 1], quantiles[:, 2]
+        small = np.where(q2 != 0, np.abs(q2 * pa), pa)
+        ell = q2 - pc * np.maximum(q2 - q1, small)
+        eul = q2 + pc * np.maximum(q3 - q2, small)
+        return np.column_stack([medians[:, 0], ell, eul]), counts
+
+    @staticmethod
+    def _grouped_hb_limits(
+        x1: np.ndarray,
+        x0: np.ndarray,
+        groups: np.ndarray,
+        n_groups: int,
+        pu: float,
+        pa: float,
+        pc: float,
+        percentiles: tuple[float, float],
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Calculate the HB limits for all groups at once.
+
+        This gives the same limits as _calculate_hb applied to each group. Rows with missing values are ignored.
+
+        Args:
+            x1: Array of values for period t.
+            x0: Array of values for period t-1.
+            groups: Array of integer group codes from 0 to n_groups - 1.
+            n_groups: Number of groups.
+            pu: Parameter that adjusts for different level of the variables.
+            pa: Parameter that adjusts for small differences between the median and the 1st or 3rd quartile.
+            pc: Parameter that controls the width of the confidence interval.
+            percentiles: Tuple for percentile values to use.
+
+        Returns:
+            Arrays with the lower and upper limit for the ratio in each row, and the number of rows with values in each group.
+        """
+        parameters, counts = Detect._grouped_hb_parameters(
+            x1,
+            x0,
+            groups,
+            n_groups,
+            pu,
+            pa,
+            pc,
+            percentiles,
+        )
+        med_ratio, ell, eul = parameters[groups].T
+        max_y_pu = np.fmax(x1, x0) ** pu
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lower_limit = med_ratio * max_y_pu / (max_y_pu - ell)
+            upper_limit = med_ratio * (max_y_pu + eul) / max_y_pu
+        return lower_limit, upper_limit, counts
+
+    @staticmethod
+    def _window_medians(windows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Calculate the median of each row of a matrix, ignoring missing values.
+
+        Each row is sorted so the missing values are last, and the median is taken from the middle of the values.
+
+        Args:
+            windows: Matrix with one window of values in each row.
+
+        Returns:
+            Array of medians, missing for rows without values, and the number of values in each row.
+        """
+        counts = np.sum(~np.isnan(windows), axis=1)
+        ordered = np.sort(windows, axis=1)
+        low = np.maximum((counts - 1) // 2, 0)[:, None]
+        high = (counts // 2)[:, None]
+        medians = (
+            np.take_along_axis(ordered, low, axis=1)[:, 0]
+            + np.take_along_axis(ordered, high, axis=1)[:, 0]
+        ) / 2
+        medians[counts == 0] = np.nan
+        return medians, counts
+
+    def rolling_median(
+        self,
+        y_var: str,
+        time_var: str,
+        window: int = 12,
+        threshold: float = 3.0,
+        min_periods: int = 3,
+        flag: str = "flag_rolling",
+        score: str = "score_rolling",
+        output_format: str = "data",
+        strata_var: str = "",
+        top_k: int | None = None,
+        top_k_by: str = "",
+    ) -> pd.DataFrame:
+        """Detect outliers compared with the median of the previous periods for each unit.
+
+        The median and the median absolute deviation (MAD) of the previous periods are calculated for all units at once, using a sliding window over the sorted panel.
+
+        Args:
+            y_var: The variable of insterest to check.
+            time_var: String variable for indicating the time period. This should be in a ISO 8601 standard format for example: 'YYYY', 'YYYY-MM', 'YYYY-MM-DD' or a SSB standard like 'YYYY-Qq'.
+            window: Integer for the number of previous periods of the unit to compare with. Periods missing from the data are not counted. Default is 12.
+            threshold: Float for the number of scaled MADs from the median for defining an outlier. Default is 3.
+            min_periods: Integer for the minimum number of previous periods with values for checking a period. Default is 3.
+            flag: String for the name of the flag variable to add to the data. Default is 'flag_rolling'.
+            score: String for the name of the score variable. The score is the number of scaled MADs from the median of the previous periods. Default is 'score_rolling'.
+            output_format: String for whether to return a data frame 'data', just the identified outlier units 'outliers', or flag counts and flagged totals for each time period 'summary'.
+            strata_var: String variable for stratification of the 'summary' output. Default is blank ("").
+            top_k: Integer for the number of most suspicious units to return. Each unit is returned once, with its highest scoring period, ordered by descending score. Overrides output_format when given.
+            top_k_by: String variable, for example a stratum, to return the top_k units within. Default is blank ("").
+
+        Returns:
+            Data frame containing the limits from the previous periods and a flag variable for identified outliers, or a dataframe containing only the outlier units. For Dask data a Dask dataframe is returned, and top_k and 'summary' are not supported.
+
+        Raises:
+            ValueError: If window or min_periods is less than 1.
+        """
+        # Check data
+        self._check_data(self.data, y_var=y_var, time_var=time_var)
+        if window < 1 or min_periods < 1:
+            mes = "window and min_periods should be at least 1."
+            raise ValueError(mes)
+
+        if self._is_dask:
+            output: pd.DataFrame = self._map_units(
+                "rolling_median",
+                ["lower_limit", "upper_limit", flag, score],
+                y_var=y_var,
+                time_var=time_var,
+                window=window,
+                threshold=threshold,
+                min_periods=min_periods,
+                flag=flag,
+                score=score,
+                output_format=output_format,
+                strata_var=strata_var,
+                top_k=top_k,
+                top_k_by=top_k_by,
+            )
+            return output
+
+        # Windows of the previous periods, with values from other units removed
+        panel = self._sort_panel(time_var)
+        order, unit_codes, unit_starts = (
+            panel.order,
+            panel.unit_codes,
+            panel.unit_starts,
+        )
+        y = panel.data[y_var].to_numpy(dtype=float, na_value=np.nan)[order]
+        n_rows = len(y)
+        padded = np.concatenate([np.full(window, np.nan), y])
+        windows = np.lib.stride_tricks.sliding_window_view(padded, window)[:n_rows]
+        position = np.arange(n_rows) - np.repeat(
+            unit_starts,
+            np.diff(np.append(unit_starts, n_rows)),
+        )
+        windows = np.where(
+            np.arange(window) >= window - position[:, None],
+            windows,
+            np.nan,
+        )
+
+        center, counts = self._window_medians(windows)
+        deviation = np.abs(y - center)
+        mad, _ = self._window_medians(np.abs(windows - center[:, None]))
+        spread = 1.4826 * mad
+        lower_limit = center - threshold * spread
+        upper_limit = center + threshold * spread
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score_values = np.where(deviation > 0, deviation / spread, 0.0)
+
+        # Flag outliers in periods with enough previous values
+        mask_na = np.isnan(y) | (counts < min_periods)
+        mask_outlier = ~mask_na & ((y < lower_limit) | (y > upper_limit))
+        flag_values = np.where(mask_na, np.nan, 0.0)
+        flag_values[mask_outlier] = 1
+        score_values[mask_na] = np.nan
+
+        # Return the most suspicious units or a summary only
+        if top_k is not None:
+            rows = self._top_k_units(
+                unit_codes,
+                unit_starts,
+                score_values,
+                top_k,
+                panel.data[top_k_by].to_numpy()[order] if top_k_by else None,
+            )
+            output = panel.data.iloc[order[rows]].copy()
+            output[flag] = flag_values[rows]
+            output[score] = score_values[rows]
+            return output
+        if output_format == "summary":
+            keys = [strata_var, time_var] if strata_var else [time_var]
+            return self._summarize_flags(
+                flag_values,
+                y,
+                {key: panel.data[key].to_numpy()[order] for key in keys},
+                y_var,
+            )
+
+        output = panel.data.iloc[order].reset_index(drop=True)
+        output["lower_limit"] = lower_limit
+        output["upper_limit"] = upper_limit
+        output[flag] = flag_values
+        output[score] = score_values
+        if output_format == "outliers":
+            output = output.loc[np.isin(unit_codes, unit_codes[mask_outlier]), :]
+        elif output_format != "data":
+            mes = "output_format is not valid. Use 'data', 'outliers' or 'summary'. Returning 'data' format."
+            self.logger.warning(mes)
+        return output
+
+    def cross_section(
+        self,
+        y_var: str,
+        time_var: str,
+        strata_var: str = "",
+        denominator: str = "",
+        method: str = "mad",
+        threshold: float = 3.0,
+        min_units: int = 5,
+        flag: str = "flag_cross",
+        score: str = "score_cross",
+        output_format: str = "data",
+    ) -> pd.DataFrame:
+        """Detect outliers compared with other units in the same stratum and time period.
+
+        This does not need previous values, so it can be used for new units. Medians and quantiles for all strata and time periods are calculated together after one sort.
+
+        Args:
+            y_var: The variable of insterest to check.
+            time_var: String variable for indicating the time period. This should be in a ISO 8601 standard format for example: 'YYYY', 'YYYY-MM', 'YYYY-MM-DD' or a SSB standard like 'YYYY-Qq'.
+            strata_var: String variable for stratification. Default is blank ("").
+            denominator: String variable to divide y_var by, for example number of employees, to check a ratio instead. Default is blank ("").
+            method: String for the method to use. 'mad' compares the distance to the median with the median absolute deviation (MAD), scaled to be comparable with a standard deviation. 'iqr' uses fences outside the quartiles based on the interquartile range. Default is 'mad'.
+            threshold: Float for the number of scaled MADs from the median ('mad'), or the number of interquartile ranges outside the quartiles ('iqr'), for defining an outlier. Default is 3.
+            min_units: Integer for the minimum number of units in a stratum and time period for checking them. Default is 5.
+            flag: String for the name of the flag variable to add to the data. Default is 'flag_cross'.
+            score: String for the name of the score variable. The score is the number of scaled MADs from the median ('mad'), or the number of interquartile ranges outside the fences ('iqr'). Default is 'score_cross'.
+            output_format: String for whether to return a data frame 'data', just the identified outliers 'outliers', or flag counts and flagged totals 'summary'.
+
+        Returns:
+            Data frame containing a flag variable for identified outliers or a dataframe containing only the outliers.
+
+        Raises:
+            ValueError: If method is not 'mad' or 'iqr'.
+        """
+        # Check data
+        self._check_data(self.data, y_var=y_var, time_var=time_var)
+        if method not in ("mad", "iqr"):
+            mes = "method should be 'mad' or 'iqr'."
+            raise ValueError(mes)
+
+        data = self._sort_panel(time_var).data
+        values = data[y_var].to_numpy(dtype=float, na_value=np.nan)
+        if denominator:
+            denominators = data[denominator].to_numpy(dtype=float, na_value=np.nan)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values = np.where(denominators > 0, values / denominators, np.nan)
+
+        # Group by stratum and time period
+        keys = [strata_var, time_var] if strata_var else [time_var]
+        groups, group_index = pd.MultiIndex.from_frame(data[keys]).factorize()
+        n_groups = len(group_index)
+
+        if method == "mad":
+            center, counts = self._grouped_quantiles(groups, values, [0.5], n_groups)
+            deviation = np.abs(values - center[groups, 0])
+            mad, _ = self._grouped_quantiles(groups, deviation, [0.5], n_groups)
+            spread = 1.4826 * mad[groups, 0]
+            lower_limit = center[groups, 0] - threshold * spread
+            upper_limit = center[groups, 0] + threshold * spread
+            with np.errstate(divide="ignore", invalid="ignore"):
+                score_values = np.where(deviation > 0, deviation / spread, 0.0)
+        else:
+            quartiles, counts = self._grouped_quantiles(
+                groups,
+                values,
+                [0.25, 0.75],
+                n_groups,
+            )
+            q1, q3 = quartiles[groups, 0], quartiles[groups, 1]
+            spread = q3 - q1
+            lower_limit = q1 - threshold * spread
+            upper_limit = q3 + threshold * spread
+            distance = np.maximum(np.maximum(q1 - values, values - q3), 0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                score_values = np.where(distance > 0, distance / spread, 0.0)
+
+        # Flag outliers in groups with enough units
+        mask_na = np.isnan(values) | (counts[groups] < min_units)
+        mask_outlier = ~mask_na & ((values < lower_limit) | (values > upper_limit))
+        flag_values = np.where(mask_na, np.nan, 0.0)
+        flag_values[mask_outlier] = 1
+        score_values[mask_na] = np.nan
+
+        if output_format == "summary":
+            return self._summarize_flags(
+                flag_values,
+                data[y_var].to_numpy(dtype=float, na_value=np.nan),
+                {key: data[key].to_numpy() for key in keys},
+                y_var,
+            )
+
+        output = data.copy()
+        output["lower_limit"] = lower_limit
+        output["upper_limit"] = upper_limit
+        output[flag] = flag_values
+        output[score] = score_values
+        if output_format == "outliers":
+            output = output.loc[mask_outlier, :]
+        elif output_format != "data":
+            mes = "output_format is not valid. Use 'data', 'outliers' or 'summary'. Returning 'data' format."
+            self.logger.warning(mes)
+        return output
@@ -0,0 +1,203 @@
+# %% [markdown]
+# # Linear edit rules
+# Rules such as 'total == a + b' or 'wages <= turnover' are parsed once into a
+# coefficient matrix and checked for all rows with one matrix product.
+
+# %%
+import ast
+
+import numpy as np
+import pandas as pd
+
+_OPERATORS = {
+    ast.Eq: "==",
+    ast.LtE: "<=",
+    ast.Lt: "<",
+    ast.GtE: ">=",
+    ast.Gt: ">",
+}
+
+
+# %%
+class EditRules:
+    """Class for checking linear edit rules."""
+
+    def __init__(
+        self,
+        rules: list[str] | dict[str, str],
+        tolerance: float = 0.0,
+    ) -> None:
+        """Initialize the edit rules.
+
+        Args:
+            rules: List of rules, or a dictionary of rule names and rules. Rules compare two linear expressions of numeric variables, for example 'total == a + b', 'wages <= turnover' or '2 * a - b >= 10'. Comparisons can be '==', '<=', '<', '>=' or '>'.
+            tolerance: Float for the allowed absolute difference before a rule is broken. Default is 0.
+
+        Raises:
+            ValueError: If a rule can not be parsed as a linear comparison.
+        """
+        if not isinstance(rules, dict):
+            rules = {f"rule_{i + 1}": rule for i, rule in enumerate(rules)}
+        self.rules = rules
+        self.tolerance = tolerance
+
+        # Parse the rules into 'expression op 0' with expression = lhs - rhs
+        parsed = []
+        for name, rule in rules.items():
+            try:
+                tree = ast.parse(rule, mode="eval").body
+                if (
+                    not isinstance(tree, ast.Compare)
+                    or len(tree.ops) != 1
+                    or type(tree.ops[0]) not in _OPERATORS
+                ):
+                    mes = "a rule should have one comparison"
+                    raise ValueError(mes)  # noqa: TRY301
+                lhs_coefs, lhs_const = self._parse_linear(tree.left)
+                rhs_coefs, rhs_const = self._parse_linear(tree.comparators[0])
+            except (SyntaxError, ValueError) as e:
+                mes = f"Rule {name} '{rule}' is not a valid linear rule: {e}"
+                raise ValueError(mes) from e
+            coefs = dict(lhs_coefs)
+            for var, coef in rhs_coefs.items():
+                coefs[var] = coefs.get(var, 0.0) - coef
+            parsed.append((coefs, lhs_const - rhs_const, type(tree.ops[0])))
+
+        self.variables = sorted({var for coefs, _, _ in parsed for var in coefs})
+        position = {var: j for j, var in enumerate(self.variables)}
+        self.coefficients = np.zeros((len(parsed), len(self.variables)))
+        self.constants = np.zeros(len(parsed))
+        self.comparisons = []
+        for i, (coefs, const, op) in enumerate(parsed):
+            for var, coef in coefs.items():
+                self.coefficients[i, position[var]] = coef
+            self.constants[i] = const
+            self.comparisons.append(_OPERATORS[op])
+
+    @classmethod
+    def _parse_linear(cls, node: ast.expr) -> tuple[dict[str, float], float]:
+        """Parse an expression into variable coefficients and a constant.
+
+        Args:
+            node: The expression node.
+
+        Returns:
+            Dictionary of coefficients for each variable, and the constant term.
+
+        Raises:
+            ValueError: If the expression is not linear.
+        """
+        if isinstance(node, ast.Name):
+            return {node.id: 1.0}, 0.0
+        if isinstance(node, ast.Constant) and isinstance(node.value, int | float):
+            return {}, float(node.value)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub | ast.UAdd):
+            coefs, const = cls._parse_linear(node.operand)
+            sign = -1.0 if isinstance(node.op, ast.USub) else 1.0
+            return {var: sign * coef for var, coef in coefs.items()}, sign * const
+        if isinstance(node, ast.BinOp):
+            left_coefs, left_const = cls._parse_linear(node.left)
+            right_coefs, right_const = cls._parse_linear(node.right)
+            if isinstance(node.op, ast.Add | ast.Sub):
+                sign = 1.0 if isinstance(node.op, ast.Add) else -1.0
+                coefs = dict(left_coefs)
+                for var, coef in right_coefs.items():
+                    coefs[var] = coefs.get(var, 0.0) + sign * coef
+                return coefs, left_const + sign * right_const
+            if isinstance(node.op, ast.Mult) and not (left_coefs and right_coefs):
+                factor, coefs, const = (
+                    (left_const, right_coefs, right_const)
+                    if not left_coefs
+                    else (right_const, left_coefs, left_const)
+                )
+                return {var: factor * coef for var, coef in coefs.items()}, (
+                    factor * const
+                )
+            if isinstance(node.op, ast.Div) and not right_coefs and right_const != 0:
+                return {
+                    var: coef / right_const for var, coef in left_coefs.items()
+                }, left_const / right_const
+        mes = f"'{ast.unparse(node)}' is not a linear expression"
+        raise ValueError(mes)
+
+    def _evaluate(self, data: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+        """Evaluate all rules for all rows.
+
+        Args:
+            data: The data to check.
+
+        Returns:
+            Matrix of differences (lhs - rhs) and matrix of broken rules (1), kept rules (0) or rules that can not be checked because of missing values (NaN), with one row per data row and one column per rule.
+
+        Raises:
+            ValueError: If a variable is missing or not numeric.
+        """
+        for var in self.variables:
+            if var not in data.columns:
+                mes = f"Missing column: {var}"
+                raise ValueError(mes)
+            if not pd.api.types.is_numeric_dtype(data[var]):
+                mes = f"{var} should be numeric."
+                raise ValueError(mes)
+
+        values = data[self.variables].to_numpy(dtype=float, na_value=np.nan)
+        is_missing = np.isnan(values)
+        difference = np.where(is_missing, 0, values) @ self.coefficients.T
+        difference += self.constants
+        not_checked = (is_missing @ (self.coefficients != 0).T) > 0
+
+        tolerance = self.tolerance
+        broken = np.zeros(difference.shape, dtype=bool)
+        for i, comparison in enumerate(self.comparisons):
+            column = difference[:, i]
+            if comparison == "==":
+                broken[:, i] = np.abs(column) > tolerance
+            elif comparison == "<=":
+                broken[:, i] = column > tolerance
+            elif comparison == "<":
+                broken[:, i] = column >= tolerance
+            elif comparison == ">=":
+                broken[:, i] = column < -tolerance
+            else:
+                broken[:, i] = column <= -tolerance
+
+        flags = np.where(not_checked, np.nan, broken.astype(float))
+        difference[not_checked] = np.nan
+        return difference, flags
+
+    def check(self, data: pd.DataFrame, flag_prefix: str = "flag_") -> pd.DataFrame:
+        """Check all rules and add a flag variable for each rule.
+
+        Args:
+            data: The data to check.
+            flag_prefix: String to put before the rule name for the name of each flag variable. Default is 'flag_'.
+
+        Returns:
+            Data frame with flag variables with 1 for broken rules, 0 for kept rules and missing when a variable in the rule is missing.
+        """
+        _, flags = self._evaluate(data)
+        output = data.copy()
+        for i, name in enumerate(self.rules):
+            output[f"{flag_prefix}{name}"] = flags[:, i]
+        return output
+
+    def violations(self, data: pd.DataFrame, id_nr: str = "") -> pd.DataFrame:
+        """Find the broken rules without adding variables to the data.
+
+        Args:
+            data: The data to check.
+            id_nr: String variable for the name of the variable to identify units with, to include in the output. Default is blank ("").
+
+        Returns:
+            Data frame with one row for each broken rule in each data row, with the row index, rule name, rule and difference between the left and right hand side.
+        """
+        difference, flags = self._evaluate(data)
+        rows, rules = np.nonzero(flags == 1)
+        names = np.array(list(self.rules.keys()), dtype=object)
+        output = pd.DataFrame({"row": data.index[rows]})
+        if id_nr:
+            output[id_nr] = data[id_nr].to_numpy()[rows]
+        output["rule_name"] = names[rules]
+        output["rule"] = np.array(list(self.rules.values()), dtype=object)[rules]
+        output["difference"] = difference[rows, rules]
+        return output
@@ -0,0 +1,311 @@
+# %% [markdown]
+# # Resident detection service
+# Keeps Detect instances and their sorted panels in memory and runs detection
+# methods on request. Requests and responses are JSON objects, one per line,
+# over a local TCP port or a Unix socket.
+
+# %%
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+
+from .detect import Detect
+
+logger = logging.getLogger("detect.service")
+
+
+# %%
+def read_data(path: str, dtype: dict[str, Any] | None = None) -> pd.DataFrame:
+    """Read a data file based on its file extension.
+
+    Args:
+        path: Path to a '.csv', '.parquet', '.feather' or '.pkl' file.
+        dtype: Optional dictionary of column types, used for csv files.
+
+    Returns:
+        The data as a pandas data frame.
+
+    Raises:
+        ValueError: If the file type is not supported.
+    """
+    suffix = Path(path).suffix.lower()
+    if suffix == ".csv":
+        return pd.read_csv(path, dtype=dtype)
+    if suffix == ".parquet":
+        return pd.read_parquet(path)
+    if suffix in (".feather", ".arrow"):
+        return pd.read_feather(path)
+    if suffix in (".pkl", ".pickle"):
+        data: pd.DataFrame = pd.read_pickle(path)  # noqa: S301
+        return data
+    mes = f"File type {suffix} is not supported. Use csv, parquet, feather or pkl."
+    raise ValueError(mes)
+
+
+class DetectService:
+    """Service keeping Detect instances in memory between requests."""
+
+    methods = ("thousand_error", "accumulation_error", "hb")
+
+    def __init__(self, max_workers: int | None = None) -> None:
+        """Initialize the service.
+
+        Args:
+            max_workers: Maximum number of worker threads for running methods. Default None uses the ThreadPoolExecutor default.
+        """
+        self.panels: dict[str, Detect] = {}
+        self.time_vars: dict[str, str] = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def load(
+        self,
+        name: str,
+        id_nr: str,
+        path: str = "",
+        data: pd.DataFrame | None = None,
+        time_var: str = "",
+        logger_level: str = "warning",
+        parent_id: str | list[str] = "",
+    ) -> dict[str, Any]:
+        """Load data into a resident Detect instance.
+
+        Args:
+            name: Name to refer to the panel in later requests.
+            id_nr: String variable for the name of the variable to identify units with.
+            path: Path to a data file. Used if data is not given.
+            data: Data frame to keep in memory.
+            time_var: String variable for the time period. If given, the sorted panel is prepared when loading.
+            logger_level: Detail level for information output.
+            parent_id: String variable, or list of variables, identifying the parent units. See Detect.
+
+        Returns:
+            Dictionary with the panel name and number of rows.
+        """
+        if data is None:
+            dtype = {col: str for col in (id_nr, time_var) if col}
+            data = read_data(path, dtype=dtype)
+        detect = Detect(
+            data,
+            id_nr=id_nr,
+            logger_level=logger_level,
+            parent_id=parent_id,
+        )
+        if time_var:
+            detect.prepare(time_var)
+        self.panels[name] = detect
+        self.time_vars[name] = time_var
+        return {"name": name, "rows": len(data)}
+
+    def _combine(self, name: str, data: list[dict[str, Any]]) -> Detect:
+        """Create a Detect instance with new records added to a resident panel.
+
+        Args:
+            name: Name of the loaded panel.
+            data: List of records to add.
+
+        Returns:
+            New Detect instance with the same settings as the resident panel.
+        """
+        detect = self.panels[name]
+        new_data = pd.DataFrame.from_records(data)
+        combined = Detect(
+            pd.concat([detect.data, new_data], ignore_index=True),
+            id_nr=detect.id_nr,
+            duplicates=detect.duplicates,
+            parent_id=detect.parent_id,
+        )
+        combined.logger.setLevel(detect.logger.level)
+        return combined
+
+    def append(
+        self,
+        name: str,
+        data: list[dict[str, Any]],
+        time_var: str = "",
+    ) -> dict[str, Any]:
+        """Add new records, for example a new period, to a resident panel.
+
+        The panel is combined and sorted once, so later requests reuse the sorted panel.
+
+        Args:
+            name: Name of the loaded panel.
+            data: List of records to add.
+            time_var: String variable for the time period to prepare the sorted panel for. Default is the time_var given when loading.
+
+        Returns:
+            Dictionary with the panel name and number of rows.
+
+        Raises:
+            ValueError: If the panel is not loaded.
+        """
+        if name not in self.panels:
+            mes = f"No panel loaded with name {name}."
+            raise ValueError(mes)
+        detect = self._combine(name, data)
+        time_var = time_var or self.time_vars.get(name, "")
+        if time_var:
+            detect.prepare(time_var)
+        self.panels[name] = detect
+        self.time_vars[name] = time_var
+        return {"name": name, "rows": len(detect.data)}
+
+    def run(
+        self,
+        name: str,
+        method: str,
+        params: dict[str, Any],
+        data: list[dict[str, Any]] | None = None,
+    ) -> pd.DataFrame:
+        """Run a detection method on a resident panel.
+
+        Args:
+            name: Name of the loaded panel.
+            method: Name of the method: 'thousand_error', 'accumulation_error' or 'hb'.
+            params: Dictionary of arguments for the method.
+            data: Optional list of records for new periods to check together with the resident panel, without keeping them. The combined panel is sorted for this request only, so use append for data that is used again.
+
+        Returns:
+            The output from the method.
+
+        Raises:
+            ValueError: If the panel is not loaded or the method is not valid.
+        """
+        if name not in self.panels:
+            mes = f"No panel loaded with name {name}."
+            raise ValueError(mes)
+        if method not in self.methods:
+            mes = f"method should be one of {self.methods}, not {method}."
+            raise ValueError(mes)
+
+        detect = self._combine(name, data) if data else self.panels[name]
+        output: pd.DataFrame = getattr(detect, method)(**params)
+        return output
+
+    async def handle(self, request: dict[str, Any]) -> dict[str, Any]:
+        """Handle one request.
+
+        Requests are dictionaries with an 'action' of 'ping', 'load', 'append', 'list', 'drop' or 'run', and the arguments for that action.
+
+        Args:
+            request: The request.
+
+        Returns:
+            Dictionary with 'status' and either 'result' or 'error'.
+        """
+        loop = asyncio.get_running_loop()
+        action = request.get("action")
+        args = {key: value for key, value in request.items() if key != "action"}
+        try:
+            if action == "ping":
+                result: Any = "pong"
+            elif action == "list":
+                result = {name: len(det.data) for name, det in self.panels.items()}
+            elif action == "drop":
+                self.time_vars.pop(args["name"], None)
+                result = self.panels.pop(args["name"], None) is not None
+            elif action == "load":
+                result = await loop.run_in_executor(
+                    self.executor,
+                    lambda: self.load(**args),
+                )
+            elif action == "append":
+                result = await loop.run_in_executor(
+                    self.executor,
+                    lambda: self.append(**args),
+                )
+            elif action == "run":
+                output = await loop.run_in_executor(
+                    self.executor,
+                    lambda: self.run(**args),
+                )
+                result = json.loads(output.to_json(orient="records"))
+            else:
+                mes = f"Unknown action: {action}"
+                raise ValueError(mes)  # noqa: TRY301
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Request failed: %s", e)
+            return {"status": "error", "error": str(e)}
+        return {"status": "ok", "result": result}
+
+    async def _handle_client(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """Answer requests from one client until it disconnects."""
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError as e:
+                    response = {"status": "error", "error": f"Invalid JSON: {e}"}
+                else:
+                    response = await self.handle(request)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            logger.debug("Client disconnected")
+        finally:
+            writer.close()
+
+    async def start(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        socket_path: str = "",
+    ) -> asyncio.Server:
+        """Start listening for requests.
+
+        Args:
+            host: Host address to listen on.
+            port: Port to listen on. Use 0 to choose a free port.
+            socket_path: Path for a Unix socket. Used instead of host and port if given.
+
+        Returns:
+            The running asyncio server.
+        """
+        limit = 2**30  # allow large requests with new period data
+        if socket_path:
+            return await asyncio.start_unix_server(
+                self._handle_client,
+                path=socket_path,
+                limit=limit,
+            )
+        return await asyncio.start_server(
+            self._handle_client,
+            host=host,
+            port=port,
+            limit=limit,
+        )
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    socket_path: str = "",
+    max_workers: int | None = None,
+) -> None:
+    """Run the detection service until interrupted.
+
+    Args:
+        host: Host address to listen on.
+        port: Port to listen on.
+        socket_path: Path for a Unix socket. Used instead of host and port if given.
+        max_workers: Maximum number of worker threads for running methods.
+    """
+    service = DetectService(max_workers=max_workers)
+
+    async def _main() -> None:
+        server = await service.start(host=host, port=port, socket_path=socket_path)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(_main())
+    finally:
+        service.executor.shutdown()
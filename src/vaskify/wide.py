@@ -0,0 +1,326 @@
+# %% [markdown]
+# # Error detection for data in wide format
+# Runs the panel methods directly on data with one column per time period. The
+# values are kept as one 2-D matrix, so differences, shifts and ratios between
+# periods are calculated column-wise without reshaping to long format.
+
+# %%
+import numpy as np
+import pandas as pd
+
+from .detect import Detect
+from .detect import _get_instance_logger
+
+
+# %%
+class DetectWide:
+    """Class for data editing of data in wide format."""
+
+    def __init__(
+        self,
+        data: pd.DataFrame,
+        id_nr: str,
+        periods: list[str] | None = None,
+        strata_var: str = "",
+        logger_level: str = "warning",
+    ) -> None:
+        """Initialize data editing object for data in wide format.
+
+        Args:
+            data: Pandas dataframe with one row per unit and one numeric column per time period.
+            id_nr: String variable for the name of the variable to identify units with.
+            periods: List of the time period columns. These should be in a ISO 8601 standard format for example: 'YYYY', 'YYYY-MM', 'YYYY-MM-DD' or a SSB standard like 'YYYY-Qq'. Default None uses all columns other than id_nr and strata_var.
+            strata_var: String variable for stratification. Default is blank ("").
+            logger_level: Detail level for information output. Choose between 'debug','info','warning','error' and 'critical'.
+
+        Raises:
+            ValueError: If a column is missing or has the wrong type, or if id_nr is not unique.
+        """
+        for col in (id_nr, strata_var):
+            if col and col not in data.columns:
+                mes = f"Missing column: {col}"
+                raise ValueError(mes)
+        if not pd.api.types.is_string_dtype(data[id_nr]):
+            mes = f"{id_nr} should be a string."
+            raise ValueError(mes)
+        if data[id_nr].duplicated().any():
+            mes = f"{id_nr} should be unique in wide format."
+            raise ValueError(mes)
+
+        if periods is None:
+            periods = [col for col in data.columns if col not in (id_nr, strata_var)]
+        for period in periods:
+            if period not in data.columns:
+                mes = f"Missing column: {period}"
+                raise ValueError(mes)
+            if not Detect._is_valid_date_format(str(period)):  # noqa: SLF001
+                mes = f"Period column {period} should be in the format 'YYYY', 'YYYY-Qq', 'YYYY-MM','YYYY-Www','YYYY-MM-DD', 'YYYY-DDD'."
+                raise ValueError(mes)
+            if not pd.api.types.is_numeric_dtype(data[period]):
+                mes = f"{period} should be numeric."
+                raise ValueError(mes)
+
+        # Create self variables with the periods in time order
+        self.data = data
+        self.id_nr = id_nr
+        self.strata_var = strata_var
+        self.periods = sorted(periods)
+        self.values = data[self.periods].to_numpy(dtype=float, na_value=np.nan)
+
+        # Start logging
+        logging_dict = {
+            "debug": 10,
+            "info": 20,
+            "warning": 30,
+            "error": 40,
+            "critical": 50,
+        }
+        self.logger = _get_instance_logger()
+        self.logger.setLevel(logging_dict[logger_level])
+
+    def _output(
+        self,
+        columns: dict[str, np.ndarray],
+        flags: np.ndarray,
+        output_format: str,
+    ) -> pd.DataFrame:
+        """Add result columns to the data and select the output format.
+
+        Args:
+            columns: Dictionary of new column names and values.
+            flags: Matrix of flags with one row per unit.
+            output_format: String for whether to return all units 'data', or just the units with at least one flag 'outliers'.
+
+        Returns:
+            Data frame in wide format.
+        """
+        keys = [self.id_nr, self.strata_var] if self.strata_var else [self.id_nr]
+        output = pd.concat(
+            [
+                self.data[keys + self.periods],
+                pd.DataFrame(columns, index=self.data.index),
+            ],
+            axis=1,
+        )
+        if output_format == "outliers":
+            output = output.loc[(flags == 1).any(axis=1), :]
+        elif output_format != "data":
+            mes = "output_format is not valid. Use 'data' or 'outliers'. Returning 'data' format."
+            self.logger.warning(mes)
+        return output
+
+    def thousand_error(
+        self,
+        lower_bound: float = -2.5,
+        upper_bound: float = 2.5,
+        flag: str = "flag_thousand",
+        impute: bool = False,
+        impute_var: str = "imputed",
+        output_format: str = "data",
+        score: str = "score_thousand",
+        scale_error: bool = False,
+        scale_tolerance: float = 0.2,
+        scale_var: str = "scale_factor",
+    ) -> pd.DataFrame:
+        """Detect thousand errors based on the previous period.
+
+        Args:
+            lower_bound: Float variable for the lower bound log factor for defining an outlier.
+            upper_bound: Float variable for the upper bound log factor for defining an outlier.
+            flag: String for the start of the name of the flag variables. Default is 'flag_thousand'.
+            impute: Boolean for whether to impute the flagged observations by dividing by 1000, or by the scale factor if scale_error is True. Default is False.
+            impute_var: String for the start of the name of the imputed variables. Default is 'imputed'.
+            output_format: String for whether to return all units 'data' or just the units with at least one identified outlier 'outliers'.
+            score: String for the start of the name of the score variables. The score is the absolute log10 difference to the previous period. Default is 'score_thousand'.
+            scale_error: Boolean for whether to detect scale errors of any power of ten, as in Detect.thousand_error. Default is False.
+            scale_tolerance: Float for the allowed log10 distance to the nearest power of ten when scale_error is True. Default is 0.2.
+            scale_var: String for the start of the name of the scale factor variables added when scale_error is True. Default is 'scale_factor'.
+
+        Returns:
+            Data frame in wide format with the variables '<flag>_<period>' and '<score>_<period>' for each period after the first, '<scale_var>_<period>' if scale_error is True, and '<impute_var>_<period>' for each period if impute is True.
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log10_values = np.log10(self.values)
+        log10_diff = np.diff(log10_values, axis=1)
+
+        if scale_error:
+            mask_outlier, scale_values = Detect._scale_factors(  # noqa: SLF001
+                log10_diff,
+                lower_bound,
+                upper_bound,
+                scale_tolerance,
+            )
+        else:
+            mask_outlier = (log10_diff > upper_bound) | (log10_diff < lower_bound)
+        flag_values = np.where(np.isnan(log10_diff), np.nan, 0.0)
+        flag_values[mask_outlier] = 1
+        score_values = np.abs(log10_diff)
+
+        columns = {}
+        for j, period in enumerate(self.periods[1:]):
+            columns[f"{flag}_{period}"] = flag_values[:, j]
+            columns[f"{score}_{period}"] = score_values[:, j]
+            if scale_error:
+                columns[f"{scale_var}_{period}"] = scale_values[:, j]
+        if impute:
+            imputed = self.values.copy()
+            imputed[:, 1:][mask_outlier] /= (
+                scale_values[mask_outlier] if scale_error else 1000
+            )
+            for j, period in enumerate(self.periods):
+                columns[f"{impute_var}_{period}"] = imputed[:, j]
+
+        return self._output(columns, flag_values, output_format)
+
+    def accumulation_error(
+        self,
+        error: float = 0.5,
+        flag: str = "flag_accumulation",
+        impute: bool = False,
+        impute_var: str = "imputed",
+        impute_weight: pd.DataFrame | None = None,
+        output_format: str = "data",
+        score: str = "score_accumulation",
+    ) -> pd.DataFrame:
+        """Detect accumulation errors based on the previous period.
+
+        Args:
+            error: Float for the allowed error factor.
+            flag: String for the start of the name of the flag variables. Default is 'flag_accumulation'.
+            impute: Boolean for whether to impute the flagged observations. Default is False. A flagged value following one or more missing or zero periods is spread back over these periods, if the unit has a reported value before them.
+            impute_var: String for the start of the name of the imputed variables. Default is 'imputed'.
+            impute_weight: Data frame in the same wide format, with the same rows and period columns, for example with the number of employees, to spread accumulated values proportionally to. Default None spreads values evenly.
+            output_format: String for whether to return all units 'data' or just the units with at least one identified outlier 'outliers'.
+            score: String for the start of the name of the score variables. The score is the growth from the previous period in excess of the allowed error. Default is 'score_accumulation'.
+
+        Returns:
+            Data frame in wide format with the variables '<flag>_<period>' and '<score>_<period>' for each period after the first, and '<impute_var>_<period>' for each period if impute is True.
+        """
+        current = self.values[:, 1:]
+        previous = self.values[:, :-1]
+
+        mask_accum = current > previous * (1 + error)
+        flag_values = np.where(np.isnan(previous), np.nan, 0.0)
+        flag_values[mask_accum] = 1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score_values = current / previous - (1 + error)
+
+        columns = {}
+        for j, period in enumerate(self.periods[1:]):
+            columns[f"{flag}_{period}"] = flag_values[:, j]
+            columns[f"{score}_{period}"] = score_values[:, j]
+        if impute:
+            # The matrix in row order is sorted by unit and time
+            n_units, n_periods = self.values.shape
+            weight = (
+                impute_weight[self.periods].to_numpy(dtype=float).ravel()
+                if impute_weight is not None
+                else None
+            )
+            imputed = Detect._spread_accumulation(  # noqa: SLF001
+                self.values.ravel(),
+                np.repeat(np.arange(n_units), n_periods),
+                np.column_stack(
+                    [np.zeros(n_units, dtype=bool), flag_values == 1],
+                ).ravel(),
+                weight,
+            ).reshape(n_units, n_periods)
+            for j, period in enumerate(self.periods):
+                columns[f"{impute_var}_{period}"] = imputed[:, j]
+
+        return self._output(columns, flag_values, output_format)
+
+    def hb(
+        self,
+        time_periods: list[str] | None = None,
+        pu: float = 0.5,
+        pa: float = 0.05,
+        pc: float = 20,
+        percentiles: tuple[float, float] = (0.25, 0.75),
+        flag: str = "flag_hb",
+        output_format: str = "data",
+        score: str = "score_hb",
+    ) -> pd.DataFrame:
+        """Outlier detection using the Hidiroglou-Berthelot (HB) method.
+
+        Each period is compared with the previous period. The limits for all periods and strata are calculated together.
+
+        Args:
+            time_periods: List of strings for the two time periods to compare. Default None compares every period with the previous period.
+            pu: Parameter that adjusts for different level of the variables. Default value 0.5.
+            pa: Parameter that adjusts for small differences between the median and the 1st or 3rd quartile. Default value 0.05.
+            pc: Parameter that controls the width of the confidence interval. Default value 20.
+            percentiles: Tuple for percentile values to use.
+            flag: String for the start of the name of the flag variables. Default is 'flag_hb'.
+            output_format: String for whether to return all units 'data' or just the units with at least one identified outlier 'outliers'.
+            score: String for the start of the name of the score variables. The score is the distance of the ratio outside the limits, scaled by max_y**pu. Default is 'score_hb'.
+
+        Returns:
+            Data frame in wide format with the variables 'ratio_<period>', 'lower_limit_<period>', 'upper_limit_<period>', '<flag>_<period>' and '<score>_<period>' for each compared period. Units without a stratum or without values above 0 in both periods have missing values.
+
+        Raises:
+            ValueError: If time_periods does not contain two of the periods.
+        """
+        if time_periods:
+            if len(time_periods) != 2 or not set(time_periods) <= set(self.periods):
+                mes = "time_periods should be two of the period columns."
+                raise ValueError(mes)
+            first, second = sorted(self.periods.index(p) for p in time_periods)
+            previous = self.values[:, [first]]
+            current = self.values[:, [second]]
+            compared = [self.periods[second]]
+        else:
+            previous = self.values[:, :-1]
+            current = self.values[:, 1:]
+            compared = self.periods[1:]
+
+        # Only units with a stratum and values above 0 in both periods are used
+        if self.strata_var:
+            strata, strata_index = pd.factorize(self.data[self.strata_var])
+            n_strata = len(strata_index)
+        else:
+            strata, n_strata = np.zeros(len(self.data), dtype=int), 1
+        valid = (current > 0) & (previous > 0) & (strata >= 0)[:, None]
+        if not valid.any():
+            mes = "No valid rows with values > 0 for both time periods."
+            self.logger.error(mes)
+        current = np.where(valid, current, np.nan)
+        previous = np.where(valid, previous, np.nan)
+
+        # Group by stratum and compared period
+        n_units, n_compared = current.shape
+        strata = np.maximum(strata, 0)
+        groups = (strata[:, None] * n_compared + np.arange(n_compared)).ravel()
+
+        lower_limit, upper_limit, _ = Detect._grouped_hb_limits(  # noqa: SLF001
+            current.ravel(),
+            previous.ravel(),
+            groups,
+            n_strata * n_compared,
+            pu,
+            pa,
+            pc,
+            percentiles,
+        )
+        lower_limit = lower_limit.reshape(n_units, n_compared)
+        upper_limit = upper_limit.reshape(n_units, n_compared)
+        ratio = current / previous
+
+        mask_outlier = (ratio < lower_limit) | (ratio > upper_limit)
+        flag_values = np.where(valid, 0.0, np.nan)
+        flag_values[mask_outlier] = 1
+        max_y_pu = np.fmax(current, previous) ** pu
+        score_values = max_y_pu * np.maximum(
+            np.maximum(lower_limit - ratio, ratio - upper_limit),
+            0,
+        )
+
+        columns = {}
+        for j, period in enumerate(compared):
+            columns[f"ratio_{period}"] = ratio[:, j]
+            columns[f"lower_limit_{period}"] = lower_limit[:, j]
+            columns[f"upper_limit_{period}"] = upper_limit[:, j]
+            columns[f"{flag}_{period}"] = flag_values[:, j]
+            columns[f"{score}_{period}"] = score_values[:, j]
+
+        return self._output(columns, flag_values, output_format)
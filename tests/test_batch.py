@@ -0,0 +1,44 @@
+"""Test cases for the batch module."""
+
+import json
+
+import pandas as pd
+
+from vaskify.batch import run_batch
+from vaskify.createdata import create_test_data
+from vaskify.detect import Detect
+
+
+def test_run_batch(tmp_path) -> None:
+    jobs = []
+    for seed in (1, 2):
+        path = tmp_path / f"survey{seed}.csv"
+        create_test_data(n=20, n_periods=3, seed=seed).to_csv(path, index=False)
+        jobs.append(
+            {
+                "path": str(path),
+                "name": f"survey{seed}",
+                "id_nr": "id_company",
+                "time_var": "time_period",
+                "methods": [
+                    {"method": "thousand_error", "params": {"y_var": "turnover"}},
+                    {"method": "unknown"},
+                ],
+            },
+        )
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(json.dumps(jobs))
+
+    timings = run_batch(str(manifest), str(tmp_path / "out"), max_workers=2)
+
+    expected_rows = 4
+    assert timings.shape[0] == expected_rows, "One row per job and method"
+    assert (tmp_path / "out" / "timings.csv").exists(), "Timings written"
+    assert (timings["status"] == ["ok", "error"] * 2).all(), "Errors are recorded"
+
+    output = pd.read_csv(timings["output"].iloc[0], dtype={"id_company": str})
+    expected = Detect(
+        create_test_data(n=20, n_periods=3, seed=1),
+        id_nr="id_company",
+    ).thousand_error(y_var="turnover", time_var="time_period")
+    assert output["flag_thousand"].equals(expected["flag_thousand"]), "Same flags"
@@ -1,6 +1,11 @@
 # %%
+import json
 import logging
 
+import numpy as np
+import pandas as pd
+import pytest
+
 from vaskify.createdata import create_test_data
 from vaskify.detect import Detect
 
@@ -18,12 +23,38 @@ def test_thousand_error() -> None:
         time_var="time_period",
         output_format="outliers",
     )
-    expected_shape = (0, 6)
+    expected_shape = (0, 7)
     assert (
         outliers.shape == expected_shape
     ), "output_format 'outlier' returns only outliers"
 
 
+def test_scale_error() -> None:
+    dt = create_test_data(n=20, n_periods=2, freq="monthly", seed=42)
+    first = dt.index[dt["time_period"] == "2020-01"]
+    second = dt.index[dt["time_period"] == "2020-02"]
+    dt.loc[second, "turnover"] = dt.loc[first, "turnover"].to_numpy() * 1.1
+    original = dt.loc[second[:3], "turnover"].to_numpy()
+    dt.loc[second[:3], "turnover"] *= [100, 1e6, 1e-3]
+
+    dt_controlled = Detect(dt, id_nr="id_company").thousand_error(
+        y_var="turnover",
+        time_var="time_period",
+        lower_bound=-1.5,
+        upper_bound=1.5,
+        impute=True,
+        scale_error=True,
+    )
+    flagged = dt_controlled.loc[dt_controlled["flag_thousand"] == 1]
+    assert len(flagged) == 3, "Each scale error flagged"
+    assert sorted(flagged["scale_factor"]) == [1e-3, 100, 1e6], "Factors found"
+    assert np.allclose(
+        np.sort(flagged["turnover_imputed"].to_numpy()),
+        np.sort(original),
+    ), "Imputed by the factor"
+    assert dt_controlled["scale_factor"].isna().sum() == 20, "First period missing"
+
+
 # %%
 def test_accumulation_error() -> None:
     dt = create_test_data(n=5, n_periods=2, freq="monthly", seed=42)
@@ -73,7 +104,7 @@ def test_hb_year() -> None:
     dt_controlled = detect.hb(y_var="turnover", time_var="time_period")
 
     assert any(dt_controlled.columns.isin(["flag_hb"])), "Flag variable created"
-    expected_shape = 5, 7
+    expected_shape = 5, 8
     assert dt_controlled.shape == expected_shape, "Wide format returned as default"
 
 
@@ -111,31 +142,475 @@ def test_hb_strata() -> None:
 
 
 # %%
+def test_hb_hierarchical_strata() -> None:
+    dt = create_test_data(n=200, n_periods=2, freq="monthly", seed=10)
+    dt["sector"] = np.where(dt["nace"] < "H", "AB", "CD")
+    detect = Detect(dt, id_nr="id_company")
+
+    dt_controlled = detect.hb(
+        y_var="turnover",
+        time_var="time_period",
+        strata_var=["sector", "nace"],
+        min_units=1,
+    )
+    expected = detect.hb(y_var="turnover", time_var="time_period", strata_var="nace")
+    assert (dt_controlled["strata_level"] == "nace").all(), "Finest level used"
+    assert dt_controlled["upper_limit"].equals(expected["upper_limit"])
+
+    dt_controlled = detect.hb(
+        y_var="turnover",
+        time_var="time_period",
+        strata_var=["sector", "nace"],
+        min_units=201,
+    )
+    expected = detect.hb(y_var="turnover", time_var="time_period")
+    assert (dt_controlled["strata_level"] == "total").all(), "All units used"
+    assert dt_controlled["upper_limit"].equals(expected["upper_limit"])
+
+    counts = dt.groupby("nace")["id_company"].nunique()
+    dt_controlled = detect.hb(
+        y_var="turnover",
+        time_var="time_period",
+        strata_var=["sector", "nace"],
+        min_units=int(counts.median()),
+    )
+    is_small = dt_controlled["nace"].map(counts) < counts.median()
+    assert (dt_controlled.loc[is_small, "strata_level"] == "sector").all()
+    assert (dt_controlled.loc[~is_small, "strata_level"] == "nace").all()
+
+
+def test_hb_ratios() -> None:
+    dt = create_test_data(n=100, n_periods=2, freq="monthly", seed=3)
+    dt["employees"] = np.arange(len(dt)) % 20
+    dt["wages"] = dt["turnover"] * (1 + np.arange(len(dt)) % 7) / 10
+    pairs = [("turnover", "employees"), ("wages", "employees")]
+    ratios = Detect(dt, id_nr="id_company").hb_ratios(
+        pairs,
+        time_var="time_period",
+        strata_var="nace",
+    )
+    assert list(ratios) == pairs, "One frame for each pair"
+
+    for numerator, denominator in pairs:
+        dt["ratio_var"] = np.where(
+            dt[denominator] > 0,
+            dt[numerator] / dt[denominator],
+            np.nan,
+        )
+        expected = Detect(dt, id_nr="id_company").hb(
+            y_var="ratio_var",
+            time_var="time_period",
+            strata_var="nace",
+        )
+        result = ratios[(numerator, denominator)]
+        for col in ["ratio", "upper_limit", "flag_hb"]:
+            assert np.array_equal(
+                result[col].to_numpy(),
+                expected[col].to_numpy(),
+            ), f"Same {col} as hb"
+
+
+def test_top_k() -> None:
+    dt = create_test_data(n=50, n_periods=3, freq="monthly", seed=10)
+    dt.loc[[4, 40, 100], "turnover"] *= 1000
+    detect = Detect(dt, id_nr="id_company")
+
+    top = detect.thousand_error(y_var="turnover", time_var="time_period", top_k=2)
+    expected_shape = 2
+    assert top.shape[0] == expected_shape, "Only top_k units returned"
+    assert top["score_thousand"].is_monotonic_decreasing, "Units ordered by score"
+    assert (top["flag_thousand"] == 1).all(), "Most suspicious units are flagged"
+
+    top = detect.accumulation_error(
+        y_var="turnover",
+        time_var="time_period",
+        top_k=1,
+        top_k_by="nace",
+    )
+    assert top.shape[0] == dt["nace"].nunique(), "One unit returned per stratum"
+    assert top["id_company"].is_unique, "Each unit returned once"
+
+    dt2 = dt.loc[dt.time_period.isin(["2020-01", "2020-02"]), :]
+    detect = Detect(dt2, id_nr="id_company")
+    wide = detect.hb(y_var="turnover", time_var="time_period", strata_var="nace")
+    top = detect.hb(
+        y_var="turnover",
+        time_var="time_period",
+        strata_var="nace",
+        top_k=3,
+    )
+    expected_ids = wide.nlargest(3, "score_hb")["id_company"].tolist()
+    assert top["id_company"].tolist() == expected_ids, "Top HB scores returned"
+
+    top = detect.hb(y_var="turnover", time_var="time_period", top_k=1, top_k_by="nace")
+    assert sorted(top["nace"]) == sorted(dt2["nace"].unique()), "Top unit by nace"
+
+
+# %%
+def test_summary() -> None:
+    dt = create_test_data(n=50, n_periods=3, freq="monthly", seed=10)
+    dt.loc[[4, 40, 100], "turnover"] *= 1000
+    detect = Detect(dt, id_nr="id_company")
+
+    summary = detect.thousand_error(
+        y_var="turnover",
+        time_var="time_period",
+        strata_var="nace",
+        output_format="summary",
+    )
+    flagged = detect.thousand_error(y_var="turnover", time_var="time_period")
+    expected = flagged.groupby(["nace", "time_period"])["flag_thousand"].sum()
+    assert (
+        summary.set_index(["nace", "time_period"])["n_flagged"] == expected
+    ).all(), "Flag counts for each stratum and period"
+    assert summary["n_units"].sum() == dt.shape[0], "All rows counted"
+
+    dt.loc[0, "nace"] = np.nan
+    summary = Detect(dt, id_nr="id_company").thousand_error(
+        y_var="turnover",
+        time_var="time_period",
+        strata_var="nace",
+        output_format="summary",
+    )
+    assert summary["nace"].notna().all(), "Missing strata left out"
+    assert summary["n_units"].sum() == dt.shape[0] - 1, "Other rows counted"
+
+    summary = detect.hb(
+        y_var="turnover",
+        time_var="time_period",
+        time_periods=["2020-01", "2020-02"],
+        output_format="summary",
+    )
+    expected_shape = 1
+    assert summary.shape[0] == expected_shape, "One row for the compared period"
+    assert summary["time_period"].iloc[0] == "2020-02", "Summary for period t"
+
+
+# %%
+def test_duplicates() -> None:
+    dt = create_test_data(n=5, n_periods=2, freq="monthly", seed=42)
+    extra = dt.iloc[[0]].assign(turnover=1.0, employees=1000)
+    dt_dup = pd.concat([dt, extra], ignore_index=True)
+
+    detect = Detect(dt_dup, id_nr="id_company")
+    with pytest.raises(ValueError, match="1 duplicate rows"):
+        detect.hb(y_var="turnover", time_var="time_period")
+
+    expected = {
+        "first": dt.loc[0, "employees"],
+        "last": 1000,
+        "sum": dt.loc[0, "employees"] + 1000,
+        "max": 1000,
+    }
+    for policy, employees in expected.items():
+        detect = Detect(dt_dup, id_nr="id_company", duplicates=policy)
+        dt_controlled = detect.thousand_error(
+            y_var="turnover",
+            time_var="time_period",
+        )
+        assert dt_controlled.shape[0] == dt.shape[0], "Duplicates resolved"
+        assert dt_controlled.loc[0, "employees"] == employees, f"{policy} used"
+
+
+# %%
+def test_cross_section() -> None:
+    dt = create_test_data(n=100, n_periods=2, freq="monthly", seed=3)
+    dt.loc[[10, 50], "turnover"] *= 50
+    detect = Detect(dt, id_nr="id_company")
+
+    for method in ["mad", "iqr"]:
+        dt_controlled = detect.cross_section(
+            y_var="turnover",
+            time_var="time_period",
+            strata_var="nace",
+            method=method,
+        )
+        assert (
+            dt_controlled.loc[[10, 50], "flag_cross"] == 1
+        ).all(), f"Outliers flagged with {method}"
+
+    assert np.allclose(
+        dt_controlled["lower_limit"] + dt_controlled["upper_limit"],
+        dt.groupby(["nace", "time_period"])["turnover"].transform(
+            lambda x: x.quantile(0.25) + x.quantile(0.75),
+        ),
+    ), "Grouped quartiles match pandas"
+
+    rng = np.random.default_rng(1)
+    dt["hours"] = rng.uniform(100, 200, size=dt.shape[0])
+    dt.loc[20, "hours"] = 1
+    detect = Detect(dt, id_nr="id_company")
+    outliers = detect.cross_section(
+        y_var="turnover",
+        time_var="time_period",
+        denominator="hours",
+        output_format="outliers",
+    )
+    assert 20 in outliers.index, "Ratio outlier flagged"
+
+
+# %%
+def test_rolling_median() -> None:
+    dt = create_test_data(n=10, n_periods=8, freq="monthly", seed=42)
+    dt = dt.sort_values(["id_company", "time_period"]).reset_index(drop=True)
+    dt.loc[7, "turnover"] *= 50
+    detect = Detect(dt, id_nr="id_company")
+    dt_controlled = detect.rolling_median(
+        y_var="turnover",
+        time_var="time_period",
+        window=4,
+    )
+
+    assert dt_controlled["flag_rolling"].iloc[:3].isna().all(), "Too few periods"
+    assert dt_controlled.loc[7, "flag_rolling"] == 1, "Outlier flagged"
+    previous = dt.loc[3:6, "turnover"].to_numpy()
+    center = np.median(previous)
+    mad = np.median(np.abs(previous - center))
+    assert dt_controlled.loc[7, "upper_limit"] == pytest.approx(
+        center + 3 * 1.4826 * mad,
+    ), "Limit from the previous periods"
+
+    outliers = detect.rolling_median(
+        y_var="turnover",
+        time_var="time_period",
+        window=4,
+        output_format="outliers",
+    )
+    assert "1" in set(outliers["id_company"]), "Outlier unit returned"
+
+
+def test_run_levels() -> None:
+    dt = create_test_data(n=20, n_periods=2, freq="monthly", seed=42)
+    dt["id_enterprise"] = "e" + (dt["id_company"].astype(int) // 4).astype(str)
+    dt.loc[1, "turnover"] *= 1e5
+    detect = Detect(dt, id_nr="id_company", parent_id="id_enterprise")
+    dt_controlled = detect.run_levels(
+        "thousand_error",
+        y_var="turnover",
+        time_var="time_period",
+    )
+    assert dt_controlled["flag_thousand"].sum() == 1, "Unit flagged"
+
+    enterprises = dt.groupby(["id_enterprise", "time_period"], as_index=False)[
+        "turnover"
+    ].sum()
+    expected = Detect(enterprises, id_nr="id_enterprise").thousand_error(
+        y_var="turnover",
+        time_var="time_period",
+    )
+    flagged = expected.loc[expected["flag_thousand"] == 1, "id_enterprise"]
+    mask = dt_controlled["id_company"].map(
+        dt.groupby("id_company")["id_enterprise"].first(),
+    ).isin(flagged) & (dt_controlled["time_period"] == "2020-02")
+    assert (
+        dt_controlled.loc[mask, "flag_thousand_id_enterprise"] == 1
+    ).all(), "Enterprise flag added to its units"
+    assert dt_controlled["flag_thousand_id_enterprise"].sum() == mask.sum() > 0
+
+
 def test_logger() -> None:
     dt = create_test_data(n=5, n_periods=2, freq="monthly", seed=42)
     detect = Detect(dt, id_nr="id_company")
-    logger = logging.getLogger("detect")
-    logger_level_observed = logger.getEffectiveLevel()
+    other = Detect(dt, id_nr="id_company", logger_level="error")
+    logger_level_observed = detect.logger.getEffectiveLevel()
     logger_level_expected = 30  # "warning"
     assert logger_level_observed == logger_level_expected, "Logger level set correctly"
 
     detect.change_logging_level("info")
-    logger_level_observed = logger.getEffectiveLevel()
+    logger_level_observed = detect.logger.getEffectiveLevel()
     logger_level_expected = 20  # "info"
     assert (
         logger_level_observed == logger_level_expected
     ), "Logger level changed correctly"
+    assert other.logger.getEffectiveLevel() == 40, "Other instances unchanged"
+    assert detect.logger.parent is logging.getLogger("detect"), "Child of 'detect'"
 
 
 # %%
-def test_no_impute(caplog) -> None:  # type: ignore[no-untyped-def]
-    dt = create_test_data(n=5, n_periods=2, freq="monthly", seed=42)
+def test_run_concurrent() -> None:
+    dt = create_test_data(n=20, n_periods=2, freq="monthly", seed=42)
+    detect = Detect(dt, id_nr="id_company")
+    outputs = detect.run_concurrent(
+        [
+            {
+                "method": "thousand_error",
+                "y_var": "turnover",
+                "time_var": "time_period",
+            },
+            {"method": "hb", "y_var": "turnover", "time_var": "time_period"},
+        ],
+    )
+
+    expected = detect.hb(y_var="turnover", time_var="time_period")
+    assert outputs[1].equals(expected), "Same output as sequential call"
+    expected_len = 2
+    assert len(outputs) == expected_len, "One output per spec"
+
+
+# %%
+def test_accumulation_impute() -> None:
+    dt = create_test_data(n=5, n_periods=4, freq="monthly", seed=42)
+    dt.loc[[1, 2, 3], "turnover"] = [0, 0, 300]
+    dt.loc[[1, 2, 3], "employees"] = [1, 1, 2]
     detect = Detect(dt, id_nr="id_company")
-    detect.accumulation_error(
+    dt_imputed = detect.accumulation_error(
         y_var="turnover",
         time_var="time_period",
         impute=True,
     )
 
-    # Check that the message was logged
-    assert "Imputation not implemented for this method." in caplog.text
+    imputed = dt_imputed.loc[dt_imputed.id_company == "0", "turnover_imputed"]
+    assert imputed.iloc[1:].tolist() == [100, 100, 100], "Value spread evenly"
+    assert (
+        dt_imputed.loc[dt_imputed.id_company != "0", "turnover_imputed"]
+        == dt_imputed.loc[dt_imputed.id_company != "0", "turnover"]
+    ).all(), "Units without gaps are unchanged"
+
+    dt_imputed = detect.accumulation_error(
+        y_var="turnover",
+        time_var="time_period",
+        impute=True,
+        impute_weight="employees",
+    )
+    imputed = dt_imputed.loc[dt_imputed.id_company == "0", "turnover_imputed"]
+    assert imputed.iloc[1:].tolist() == [75, 75, 150], "Value spread by weight"
+
+
+def test_accumulation_impute_flagged_only() -> None:
+    dt = pd.DataFrame(
+        {
+            "id": ["a"] * 3 + ["b"] * 3,
+            "tp": ["2020-01", "2020-02", "2020-03"] * 2,
+            "y": [100, np.nan, 120, 0, 0, 300],
+        },
+    )
+    dt_imputed = Detect(dt, id_nr="id").accumulation_error(
+        y_var="y",
+        time_var="tp",
+        impute=True,
+    )
+    assert dt_imputed.loc[2, "y_imputed"] == 120, "Value not flagged is unchanged"
+    assert dt_imputed.loc[5, "flag_accumulation"] == 1
+    assert dt_imputed["y_imputed"].iloc[3:].tolist() == [0, 0, 300], (
+        "Gaps before the first reported value are not filled"
+    )
+
+
+# %%
+def test_from_npy(tmp_path) -> None:
+    dt = create_test_data(n=10, n_periods=3, freq="monthly", seed=42)
+    for col in dt.columns:
+        values = dt[col].to_numpy()
+        if not pd.api.types.is_numeric_dtype(dt[col]):
+            values = values.astype(str)
+        np.save(tmp_path / f"{col}.npy", values)
+
+    detect = Detect.from_npy(str(tmp_path), id_nr="id_company")
+    assert not detect.data["turnover"].to_numpy().flags.writeable, "Column is mapped"
+
+    dt_controlled = detect.thousand_error(y_var="turnover", time_var="time_period")
+    expected = Detect(dt, id_nr="id_company").thousand_error(
+        y_var="turnover",
+        time_var="time_period",
+    )
+    assert dt_controlled["score_thousand"].equals(expected["score_thousand"])
+
+
+def test_from_arrow(tmp_path) -> None:
+    feather = pytest.importorskip("pyarrow.feather")
+    dt = create_test_data(n=10, n_periods=2, freq="monthly", seed=42)
+    path = tmp_path / "data.arrow"
+    feather.write_feather(dt, path, compression="uncompressed")
+
+    detect = Detect.from_arrow(str(path), id_nr="id_company")
+    dt_controlled = detect.hb(y_var="turnover", time_var="time_period")
+    expected = Detect(dt, id_nr="id_company").hb(
+        y_var="turnover",
+        time_var="time_period",
+    )
+    assert dt_controlled["flag_hb"].equals(expected["flag_hb"]), "Same flags"
+
+
+def test_save_load(tmp_path) -> None:
+    dt = create_test_data(n=50, n_periods=2, freq="monthly", seed=42)
+    detect = Detect(dt, id_nr="id_company")
+    expected = detect.hb(y_var="turnover", time_var="time_period", strata_var="nace")
+    detect.save(str(tmp_path), time_var="time_period")
+
+    meta = json.loads((tmp_path / "meta.json").read_text())
+    assert len(meta["hb_tables"]) == 1, "HB limits are saved"
+
+    loaded = Detect.load(str(tmp_path), data=dt)
+    dt_controlled = loaded.hb(
+        y_var="turnover",
+        time_var="time_period",
+        strata_var="nace",
+    )
+    for col in ["lower_limit", "upper_limit", "flag_hb"]:
+        assert dt_controlled[col].equals(expected[col]), f"Same {col}"
+
+    changed = dt.copy()
+    changed.loc[0, "turnover"] += 1
+    with pytest.raises(ValueError, match="changed"):
+        Detect.load(str(tmp_path), data=changed)
+
+
+def test_dask() -> None:
+    dd = pytest.importorskip("dask.dataframe")
+    distributed = pytest.importorskip("distributed")
+    dt = create_test_data(n=40, n_periods=3, freq="monthly", seed=42)
+    dt.loc[4, "turnover"] *= 1000
+    detection = Detect(dt, id_nr="id_company")
+
+    def _sorted(data: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+        return data.sort_values(keys).reset_index(drop=True)
+
+    with distributed.LocalCluster(
+        n_workers=2,
+        threads_per_worker=1,
+        dashboard_address=None,
+    ) as cluster, distributed.Client(cluster):
+        for ddt in (
+            dd.from_pandas(dt, npartitions=3),
+            dd.from_pandas(dt.set_index("id_company"), npartitions=3),
+        ):
+            dask_detection = Detect(ddt, id_nr="id_company")
+            for method in ("thousand_error", "accumulation_error"):
+                expected = getattr(detection, method)(
+                    y_var="turnover",
+                    time_var="time_period",
+                )
+                observed = getattr(dask_detection, method)(
+                    y_var="turnover",
+                    time_var="time_period",
+                ).compute()
+                pd.testing.assert_frame_equal(
+                    _sorted(observed, ["id_company", "time_period"]),
+                    _sorted(expected, ["id_company", "time_period"]),
+                    check_dtype=False,
+                )
+
+            expected = detection.hb(
+                y_var="turnover",
+                time_var="time_period",
+                time_periods=["2020-02", "2020-03"],
+                strata_var="nace",
+            )
+            observed = dask_detection.hb(
+                y_var="turnover",
+                time_var="time_period",
+                time_periods=["2020-02", "2020-03"],
+                strata_var="nace",
+            ).compute()
+            pd.testing.assert_frame_equal(
+                _sorted(observed, ["id_company"]),
+                _sorted(expected, ["id_company"]),
+                check_dtype=False,
+            )
+
+    with pytest.raises(ValueError, match="not supported for Dask data"):
+        dask_detection.thousand_error(
+            y_var="turnover",
+            time_var="time_period",
+            top_k=5,
+        )
@@ -1,10 +1,19 @@
 """Test cases for the __main__ module."""
 
+import importlib.metadata
+import os
+import subprocess
+import sys
+from pathlib import Path
+
 import pytest
 from click.testing import CliRunner
 
+import vaskify
 from vaskify import __main__
 
+IMPORT_BUDGET_US = 200_000  # import time budget for the package in microseconds
+
 
 @pytest.fixture
 def runner() -> CliRunner:
@@ -16,3 +25,53 @@ def test_main_succeeds(runner: CliRunner) -> None:
     """It exits with a status code of zero."""
     result = runner.invoke(__main__.main)
     assert result.exit_code == 0
+
+
+def test_serve_help(runner: CliRunner) -> None:
+    """It shows help for the serve command."""
+    result = runner.invoke(__main__.main, ["serve", "--help"])
+    assert result.exit_code == 0
+
+
+def _run_python(code: str, *options: str) -> subprocess.CompletedProcess[str]:
+    """Run python code in a new process with vaskify on the path."""
+    env = {**os.environ, "PYTHONPATH": str(Path(vaskify.__file__).parents[1])}
+    return subprocess.run(  # noqa: S603
+        [sys.executable, *options, "-c", code],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+
+
+def test_import_time() -> None:
+    """It imports the package within the time budget."""
+    result = _run_python("import vaskify", "-X", "importtime")
+    cumulative = next(
+        int(line.split("|")[1])
+        for line in result.stderr.splitlines()
+        if line.split("|")[-1].strip() == "vaskify"
+    )
+    assert cumulative < IMPORT_BUDGET_US, f"Import took {cumulative} us"
+
+
+@pytest.mark.parametrize("option", ["--help", "--version"])
+def test_cli_does_not_import_pandas(option: str) -> None:
+    """It does not import pandas for --help or --version."""
+    if option == "--version":
+        try:
+            importlib.metadata.version("ssb-vaskify")
+        except importlib.metadata.PackageNotFoundError:
+            pytest.skip("--version needs the package to be installed")
+    code = (
+        "import sys\n"
+        "from vaskify.__main__ import main\n"
+        "try:\n"
+        f"    main([{option!r}], prog_name='ssb-vaskify')\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print('pandas' in sys.modules, 'numpy' in sys.modules)\n"
+    )
+    result = _run_python(code)
+    assert result.stdout.splitlines()[-1] == "False False"
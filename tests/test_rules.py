@@ -0,0 +1,48 @@
+# %%
+import numpy as np
+import pandas as pd
+import pytest
+
+from vaskify.rules import EditRules
+
+
+# %%
+def test_edit_rules() -> None:
+    data = pd.DataFrame(
+        {
+            "id_company": ["a", "b", "c", "d"],
+            "total": [10.0, 10.0, 11.5, np.nan],
+            "part1": [4.0, 4.0, 4.0, 4.0],
+            "part2": [6.0, 5.0, 7.0, 6.0],
+            "wages": [5, 12, 3, 2],
+            "turnover": [10, 10, 10, 10],
+        },
+    )
+    rules = EditRules(
+        {"sum_total": "total == part1 + part2", "wages": "wages <= turnover"},
+        tolerance=0.5,
+    )
+    assert rules.variables == ["part1", "part2", "total", "turnover", "wages"]
+
+    checked = rules.check(data)
+    assert checked["flag_sum_total"].tolist()[:3] == [0, 1, 0]
+    assert np.isnan(checked["flag_sum_total"].iloc[3]), "Missing values not checked"
+    assert checked["flag_wages"].tolist() == [0, 1, 0, 0]
+
+    violations = rules.violations(data, id_nr="id_company")
+    assert violations["id_company"].tolist() == ["b", "b"]
+    assert violations["rule_name"].tolist() == ["sum_total", "wages"]
+    assert violations["difference"].tolist() == [1.0, 2.0]
+
+
+def test_edit_rules_parsing() -> None:
+    rules = EditRules(["2 * (a - b) / 4 + 1 > -c"])
+    assert rules.coefficients.tolist() == [[0.5, -0.5, 1.0]]
+    assert rules.constants.tolist() == [1.0]
+
+    with pytest.raises(ValueError, match="not a linear expression"):
+        EditRules(["a * b == c"])
+    with pytest.raises(ValueError, match="one comparison"):
+        EditRules(["a + b"])
+    with pytest.raises(ValueError, match="Missing column"):
+        EditRules(["a <= b"]).check(pd.DataFrame({"a": [1]}))
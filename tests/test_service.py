@@ -0,0 +1,90 @@
+"""Test cases for the service module."""
+
+import asyncio
+import json
+
+import pandas as pd
+
+from vaskify.createdata import create_test_data
+from vaskify.detect import Detect
+from vaskify.service import DetectService
+
+
+async def _request(port: int, requests: list[dict]) -> list[dict]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    responses = []
+    for request in requests:
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        responses.append(json.loads(await reader.readline()))
+    writer.close()
+    await writer.wait_closed()
+    return responses
+
+
+def test_service(tmp_path) -> None:
+    dt = create_test_data(n=20, n_periods=3, freq="monthly", seed=42)
+    path = tmp_path / "panel.csv"
+    dt.to_csv(path, index=False)
+    new_period = create_test_data(n=20, n_periods=4, freq="monthly", seed=1)
+    new_period = new_period.loc[new_period.time_period == "2020-04", :]
+    params = {"y_var": "turnover", "time_var": "time_period"}
+
+    async def _run() -> list[dict]:
+        service = DetectService(max_workers=2)
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            responses = await _request(
+                port,
+                [
+                    {"action": "ping"},
+                    {
+                        "action": "load",
+                        "name": "panel",
+                        "path": str(path),
+                        "id_nr": "id_company",
+                        "time_var": "time_period",
+                    },
+                    {
+                        "action": "run",
+                        "name": "panel",
+                        "method": "thousand_error",
+                        "params": params,
+                    },
+                    {
+                        "action": "run",
+                        "name": "panel",
+                        "method": "accumulation_error",
+                        "params": params,
+                        "data": new_period.to_dict(orient="records"),
+                    },
+                    {
+                        "action": "append",
+                        "name": "panel",
+                        "data": new_period.to_dict(orient="records"),
+                    },
+                    {
+                        "action": "run",
+                        "name": "panel",
+                        "method": "accumulation_error",
+                        "params": params,
+                    },
+                    {"action": "run", "name": "missing", "method": "hb"},
+                ],
+            )
+        service.executor.shutdown()
+        return responses
+
+    ping, load, run, run_new, append, run_appended, missing = asyncio.run(_run())
+
+    assert ping["result"] == "pong", "Service responds"
+    assert load["result"]["rows"] == dt.shape[0], "Panel loaded"
+    expected = Detect(dt, id_nr="id_company").thousand_error(**params)
+    result = pd.DataFrame(run["result"])
+    assert result["flag_thousand"].sum() == expected["flag_thousand"].sum()
+    assert result.shape == expected.shape, "Same output as Detect"
+    assert len(run_new["result"]) == dt.shape[0] + 20, "New period included"
+    assert append["result"]["rows"] == dt.shape[0] + 20, "New period appended"
+    assert run_appended["result"] == run_new["result"], "Appended panel reused"
+    assert missing["status"] == "error", "Errors are returned"
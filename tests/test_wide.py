@@ -0,0 +1,101 @@
+# %%
+import numpy as np
+import pandas as pd
+import pytest
+
+from vaskify.createdata import create_test_data
+from vaskify.detect import Detect
+from vaskify.wide import DetectWide
+
+
+# %%
+def _wide_test_data() -> tuple[pd.DataFrame, pd.DataFrame]:
+    dt = create_test_data(n=50, n_periods=3, freq="monthly", seed=42)
+    dt.loc[4, "turnover"] *= 1000
+    wide = dt.pivot_table(
+        index="id_company",
+        columns="time_period",
+        values="turnover",
+        aggfunc="first",
+    )
+    wide.columns.name = None
+    wide = wide.reset_index().merge(
+        dt.groupby("id_company", as_index=False)["nace"].first(),
+    )
+    return dt, wide
+
+
+def test_wide_thousand_error() -> None:
+    dt, wide = _wide_test_data()
+    detection = DetectWide(wide, id_nr="id_company", strata_var="nace")
+    assert detection.periods == ["2020-01", "2020-02", "2020-03"]
+
+    dt_controlled = detection.thousand_error(impute=True)
+    assert dt_controlled.shape == (50, 12)
+    assert dt_controlled["flag_thousand_2020-02"].sum() == 1, "Outlier flagged"
+    assert dt_controlled.loc[1, "imputed_2020-02"] == pytest.approx(
+        wide.loc[1, "2020-02"] / 1000,
+    )
+
+    long = Detect(dt, id_nr="id_company").thousand_error(
+        y_var="turnover",
+        time_var="time_period",
+    )
+    expected = long.loc[long["time_period"] == "2020-03", "flag_thousand"]
+    assert np.array_equal(
+        dt_controlled["flag_thousand_2020-03"].to_numpy(),
+        expected.to_numpy(),
+    ), "Same flags as for long format"
+
+    outliers = detection.thousand_error(output_format="outliers")
+    assert outliers["id_company"].tolist() == ["1"]
+
+
+def test_wide_accumulation_error() -> None:
+    _, wide = _wide_test_data()
+    wide.loc[2, "2020-02"] = 0
+    wide.loc[3, ["2020-01", "2020-02"]] = [np.nan, 0]
+    detection = DetectWide(wide.drop(columns="nace"), id_nr="id_company")
+    dt_controlled = detection.accumulation_error(impute=True)
+    assert dt_controlled.loc[2, "flag_accumulation_2020-03"] == 1
+    assert dt_controlled.loc[2, "imputed_2020-02"] == pytest.approx(
+        wide.loc[2, "2020-03"] / 2,
+    )
+    assert dt_controlled.loc[3, "imputed_2020-02"] == 0, "Leading gap not filled"
+
+
+def test_wide_hb() -> None:
+    dt, wide = _wide_test_data()
+    detection = DetectWide(wide, id_nr="id_company", strata_var="nace")
+    dt_controlled = detection.hb()
+    assert "flag_hb_2020-02" in dt_controlled.columns
+    assert "flag_hb_2020-03" in dt_controlled.columns
+
+    long = Detect(dt, id_nr="id_company").hb(
+        y_var="turnover",
+        time_var="time_period",
+        time_periods=["2020-02", "2020-03"],
+        strata_var="nace",
+    )
+    assert np.allclose(
+        dt_controlled["upper_limit_2020-03"].to_numpy(),
+        long["upper_limit"].to_numpy(),
+    ), "Same limits as for long format"
+
+    with pytest.raises(ValueError, match="two of the period columns"):
+        detection.hb(time_periods=["2020-01"])
+
+    wide.loc[0, "nace"] = np.nan
+    dt.loc[dt["id_company"] == wide.loc[0, "id_company"], "nace"] = np.nan
+    dt_controlled = DetectWide(wide, id_nr="id_company", strata_var="nace").hb()
+    assert np.isnan(dt_controlled.loc[0, "flag_hb_2020-03"]), "Unit without stratum"
+    long = Detect(dt, id_nr="id_company").hb(
+        y_var="turnover",
+        time_var="time_period",
+        time_periods=["2020-02", "2020-03"],
+        strata_var="nace",
+    )
+    assert np.allclose(
+        dt_controlled["upper_limit_2020-03"].dropna().to_numpy(),
+        long["upper_limit"].to_numpy(),
+    ), "Same limits as for long format without the unit"